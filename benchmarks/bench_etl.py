@@ -0,0 +1,494 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "dags"))
+
+from bench_api import (  # noqa: E402
+    BENCH_DATABASE_URL,
+    check_disposable,
+    git_commit,
+    load_rows,
+)
+
+PHASES = ["list", "fetch", "parse", "upsert"]
+# Values the DAG's validation rejects, used to send a share of records to quarantine
+INVALID_VALUES = [("tenure", -1), ("Contract", "Weekly"), ("gender", None)]
+
+
+class PhaseTimer:
+    """
+    Accumulate the wall time spent in every phase of the ETL callable.
+
+    Attributes:
+        totals (dict): The seconds spent per phase.
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+
+    def wrap(self, phase, fn):
+        """
+        Wrap a function so the time spent in it counts towards a phase.
+
+        Args:
+            phase (str): The phase name.
+            fn (callable): The function to time.
+
+        Returns:
+            callable: The timed function.
+        """
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.totals[phase] += time.perf_counter() - start
+
+        return timed
+
+
+class MemorySampler(threading.Thread):
+    """
+    Sample the resident set size of the process in the background.
+
+    Reads /proc/self/statm, so the peak is only measured on Linux.
+
+    Attributes:
+        interval (float): The time in seconds between samples.
+        baseline (int): The RSS in bytes when sampling started.
+        peak (int): The highest RSS in bytes seen so far.
+    """
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._stopped = threading.Event()
+        self.baseline = self.peak = self.rss()
+
+    def rss(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            return 0
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def install_airflow_stand_ins():
+    """
+    Register minimal airflow modules so the DAG file imports without Airflow.
+
+    Only the names etl_dag imports are provided. The hooks are replaced by local
+    ones after the import anyway, and DAG and PythonOperator only record their
+    arguments. Nothing is registered when Airflow is installed.
+    """
+    try:
+        import airflow  # noqa: F401
+
+        return
+    except ImportError:
+        pass
+
+    class Recorder:
+        def __init__(self, *args, **kwargs):
+            self.args = args
+            self.kwargs = kwargs
+
+    modules = {
+        "airflow": {"DAG": Recorder},
+        "airflow.operators": {},
+        "airflow.operators.python": {"PythonOperator": Recorder},
+        "airflow.providers": {},
+        "airflow.providers.amazon": {},
+        "airflow.providers.amazon.aws": {},
+        "airflow.providers.amazon.aws.hooks": {},
+        "airflow.providers.amazon.aws.hooks.s3": {"S3Hook": Recorder},
+        "airflow.providers.postgres": {},
+        "airflow.providers.postgres.hooks": {},
+        "airflow.providers.postgres.hooks.postgres": {"PostgresHook": Recorder},
+        "airflow.providers.redis": {},
+        "airflow.providers.redis.hooks": {},
+        "airflow.providers.redis.hooks.redis": {"RedisHook": Recorder},
+    }
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+
+def load_etl_dag(s3_client, database_url, timer):
+    """
+    Import the s3_to_rds DAG module and point its hooks at local stand-ins.
+
+    The S3 hook uses the given client, the Postgres hook connects to the given
+    database with psycopg2 and the Redis hook returns an in-memory fakeredis client.
+    The list, fetch, parse and upsert steps of read_transform_store_data are timed
+    with the timer, commits count as upsert.
+
+    Args:
+        s3_client (boto3.client): The S3 client of the local stand-in.
+        database_url (str): The SQLAlchemy URL of a Postgres database.
+        timer (PhaseTimer): Collects the time of every phase.
+
+    Returns:
+        module: The etl_dag module.
+    """
+    import psycopg2
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+
+    import fakeredis
+
+    install_airflow_stand_ins()
+    import etl_dag
+
+    dsn = (
+        make_url(database_url)
+        .set(drivername="postgresql")
+        .render_as_string(hide_password=False)
+    )
+
+    class TimedObject:
+        def __init__(self, key, bucket):
+            self.key = key
+            self.bucket = bucket
+
+        def get(self):
+            body = timer.wrap("fetch", self._read)()
+            return {"Body": types.SimpleNamespace(read=lambda: body)}
+
+        def _read(self):
+            response = s3_client.get_object(Bucket=self.bucket, Key=self.key)
+            return response["Body"].read()
+
+    class LocalS3Hook:
+        def __init__(self, aws_conn_id=None):
+            pass
+
+        def get_conn(self):
+            return s3_client
+
+        def get_key(self, key, bucket_name):
+            return TimedObject(key, bucket_name)
+
+    class TimedConnection:
+        def __init__(self, conn):
+            self._conn = conn
+            self.commit = timer.wrap("upsert", conn.commit)
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+    class LocalPostgresHook:
+        def __init__(self, postgres_conn_id=None):
+            pass
+
+        def get_conn(self):
+            return TimedConnection(psycopg2.connect(dsn))
+
+        def get_sqlalchemy_engine(self):
+            return create_engine(database_url)
+
+    class LocalRedisHook:
+        def __init__(self, redis_conn_id=None):
+            pass
+
+        def get_conn(self):
+            return fakeredis.FakeRedis()
+
+    etl_dag.S3Hook = LocalS3Hook
+    etl_dag.PostgresHook = LocalPostgresHook
+    etl_dag.RedisHook = LocalRedisHook
+    etl_dag.list_keys_recursive = timer.wrap("list", etl_dag.list_keys_recursive)
+    etl_dag.parse_records = timer.wrap("parse", etl_dag.parse_records)
+    etl_dag.store_chunk = timer.wrap("upsert", etl_dag.store_chunk)
+    return etl_dag
+
+
+def generate_records(rows, count, customers, invalid_rate, seed):
+    """
+    Generate synthetic stream records from the sample customers.
+
+    Args:
+        rows (list): The sample customers as dicts.
+        count (int): The number of records.
+        customers (int): The number of distinct customerIDs, records past it update earlier customers.
+        invalid_rate (float): The fraction of records with a value the DAG rejects.
+        seed (int): The random seed.
+
+    Yields:
+        dict: The next record.
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        record = dict(rows[i % len(rows)], customerID=f"{i % customers:010d}-SYN")
+        if invalid_rate and rng.random() < invalid_rate:
+            field, value = rng.choice(INVALID_VALUES)
+            record[field] = value
+        yield record
+
+
+def upload_objects(s3_client, bucket, records, encoding, object_sizes):
+    """
+    Write records to S3 as Firehose would, concatenated into objects.
+
+    Objects are cut once they reach their target size, cycling through the sizes
+    to mimic Firehose flushing on size or on its buffer interval. Keys follow the
+    Firehose YYYY/MM/DD/HH/ layout.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        bucket (str): The bucket name.
+        records (iterable): The records to write.
+        encoding (str): The record encoding, "json" or "compact".
+        object_sizes (list): The target object sizes in MiB.
+
+    Returns:
+        tuple: The number of objects and of bytes written.
+    """
+    from record_codec import encode_record
+
+    now = datetime.now(timezone.utc)
+    prefix = now.strftime("%Y/%m/%d/%H/")
+    objects, written = 0, 0
+    parts, size = [], 0
+
+    def flush():
+        nonlocal objects, written, parts, size
+        key = f"{prefix}app-stream-1-{now:%Y-%m-%d-%H-%M-%S}-{uuid.uuid4()}"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=b"".join(parts))
+        objects += 1
+        written += size
+        parts, size = [], 0
+
+    for record in records:
+        if encoding == "compact":
+            data = encode_record(record)
+        else:
+            data = json.dumps(record).encode()
+        parts.append(data)
+        size += len(data)
+        if size >= object_sizes[objects % len(object_sizes)] * 1024 * 1024:
+            flush()
+    if parts:
+        flush()
+    return objects, written
+
+
+def reset_database(database_url, overwrite=False):
+    """
+    Recreate the tables of data_schema, empty.
+
+    Args:
+        database_url (str): The SQLAlchemy URL of a Postgres database.
+        overwrite (bool): Whether a non-empty TelecomUsers table may be dropped.
+    """
+    from sqlalchemy import create_engine
+    from data_schema import Base
+
+    engine = create_engine(database_url)
+    check_disposable(engine, overwrite)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+
+def count_rows(database_url):
+    """
+    Count the rows of TelecomUsers and TelecomUsersQuarantine.
+
+    Args:
+        database_url (str): The SQLAlchemy URL of a Postgres database.
+
+    Returns:
+        tuple: The number of customers and of quarantined records.
+    """
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        customers = conn.execute(text('SELECT COUNT(*) FROM "TelecomUsers"')).scalar()
+        quarantined = conn.execute(
+            text('SELECT COUNT(*) FROM "TelecomUsersQuarantine"')
+        ).scalar()
+    engine.dispose()
+    return customers, quarantined
+
+
+def run_etl(etl_dag, timer):
+    """
+    Run read_transform_store_data once and measure it.
+
+    Args:
+        etl_dag (module): The DAG module returned by load_etl_dag.
+        timer (PhaseTimer): The timer wrapped around its phases.
+
+    Returns:
+        dict: The elapsed time, the time per phase and the peak RSS increase.
+    """
+    timer.totals = dict.fromkeys(PHASES, 0.0)
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        etl_dag.read_transform_store_data()
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+    phases = {phase: round(seconds, 3) for phase, seconds in timer.totals.items()}
+    phases["other"] = round(max(elapsed - sum(timer.totals.values()), 0.0), 3)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "phases_s": phases,
+        "peak_rss_increase_mb": round((sampler.peak - sampler.baseline) / 2**20, 1),
+    }
+
+
+if __name__ == "__main__":
+    """
+    Benchmark the s3_to_rds DAG callable on synthetic Firehose objects.
+
+    Records generated from input.csv are written as concatenated records to a moto
+    S3 bucket, or to the S3 compatible endpoint given with --endpoint-url, and
+    read_transform_store_data loads them into a local Postgres. Every run reports
+    the throughput, the peak memory and the time spent listing, fetching, parsing
+    and upserting. The first run inserts, later runs update the same customers.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--database-url",
+        default=BENCH_DATABASE_URL,
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Drop the tables even if TelecomUsers holds rows",
+    )
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument(
+        "--customers",
+        type=int,
+        default=None,
+        help="Distinct customerIDs, defaults to --records",
+    )
+    parser.add_argument(
+        "--object-sizes",
+        type=float,
+        nargs="+",
+        default=[1, 5, 32],
+        help="Target object sizes in MiB, cycled",
+    )
+    parser.add_argument("--encoding", choices=["json", "compact"], default="json")
+    parser.add_argument("--invalid-rate", type=float, default=0.01)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--endpoint-url", help="S3 compatible endpoint used instead of moto"
+    )
+    parser.add_argument("--output", default="bench_etl_results.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+    import boto3
+    from moto import mock_aws
+
+    mock = None
+    if args.endpoint_url is None:
+        mock = mock_aws()
+        mock.start()
+    try:
+        s3_client = boto3.client(
+            "s3", region_name="us-east-1", endpoint_url=args.endpoint_url
+        )
+        timer = PhaseTimer()
+        etl_dag = load_etl_dag(s3_client, args.database_url, timer)
+        reset_database(args.database_url, args.overwrite)
+        s3_client.create_bucket(Bucket=etl_dag.BUCKET_NAME)
+
+        rows = load_rows().to_dict(orient="records")
+        records = generate_records(
+            rows,
+            args.records,
+            args.customers or args.records,
+            args.invalid_rate,
+            args.seed,
+        )
+        start = time.perf_counter()
+        objects, written = upload_objects(
+            s3_client, etl_dag.BUCKET_NAME, records, args.encoding, args.object_sizes
+        )
+        print(
+            f"Wrote {args.records} records in {objects} objects "
+            f"({written / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f}s"
+        )
+
+        results = []
+        for run in range(args.runs):
+            result = run_etl(etl_dag, timer)
+            result["records_per_s"] = round(args.records / result["elapsed_s"], 1)
+            result["mib_per_s"] = round(written / 2**20 / result["elapsed_s"], 2)
+            results.append(result)
+
+            phases = ", ".join(
+                f"{phase} {seconds:.2f}s"
+                for phase, seconds in result["phases_s"].items()
+            )
+            print(
+                f"Run {run + 1}: {result['elapsed_s']:.2f}s, "
+                f"{result['records_per_s']:.0f} records/s, "
+                f"{result['mib_per_s']:.1f} MiB/s, "
+                f"peak RSS +{result['peak_rss_increase_mb']:.0f} MiB ({phases})"
+            )
+        customers, quarantined = count_rows(args.database_url)
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    print(f"TelecomUsers: {customers} customers, quarantine: {quarantined} records")
+    best = min(result["elapsed_s"] for result in results)
+    print(f"At the best rate 10M records take {1e7 / args.records * best / 60:.1f} min")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "records": args.records,
+            "customers": args.customers or args.records,
+            "objects": objects,
+            "bytes": written,
+            "encoding": args.encoding,
+            "invalid_rate": args.invalid_rate,
+            "s3": args.endpoint_url or "moto",
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
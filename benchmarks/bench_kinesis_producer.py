@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from kinesis_producer import KinesisProducer  # noqa: E402
+
+
+class StubKinesisClient:
+    """
+    Kinesis stand-in that counts calls and sleeps for a fixed network latency.
+
+    Attributes:
+        latency (float): The simulated round trip time in seconds.
+        calls (int): The number of API calls made.
+        records (int): The number of records received.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.records = 0
+
+    def put_record(self, **kwargs):
+        self.calls += 1
+        self.records += 1
+        time.sleep(self.latency)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def put_records(self, Records, **kwargs):
+        self.calls += 1
+        self.records += len(Records)
+        time.sleep(self.latency)
+        return {"Records": [{"SequenceNumber": "0"} for _ in Records]}
+
+
+async def run_direct(client, records, concurrency):
+    """
+    Send every record with its own PutRecord call, like the unbuffered ingest path.
+
+    Args:
+        client (StubKinesisClient): The stub client.
+        records (int): The number of records to send.
+        concurrency (int): The number of concurrent senders.
+
+    Returns:
+        list: The latency of every record in seconds.
+    """
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await asyncio.to_thread(
+                client.put_record, StreamName="bench", Data="{}", PartitionKey=str(i)
+            )
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(send(i) for i in range(records)))
+    return latencies
+
+
+async def run_buffered(client, records, concurrency, wait):
+    """
+    Send every record through the buffered producer.
+
+    Args:
+        client (StubKinesisClient): The stub client.
+        records (int): The number of records to send.
+        concurrency (int): The number of concurrent senders.
+        wait (bool): Whether senders wait for their record to be flushed.
+
+    Returns:
+        list: The latency of every record in seconds.
+    """
+    producer = KinesisProducer(client, "bench")
+    await producer.start()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(i):
+        async with semaphore:
+            start = time.perf_counter()
+            future = await producer.put("{}", str(i))
+            if wait:
+                await future
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(send(i) for i in range(records)))
+    await producer.stop()
+    return latencies
+
+
+if __name__ == "__main__":
+    """
+    Compare per-record PutRecord calls with the buffered PutRecords producer.
+
+    Reports the Kinesis calls per record, the throughput and the per-record latency
+    percentiles against a stub client with a fixed network latency.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    modes = {
+        "direct": lambda client: run_direct(client, args.records, args.concurrency),
+        "buffered (wait)": lambda client: run_buffered(
+            client, args.records, args.concurrency, True
+        ),
+        "buffered (ack)": lambda client: run_buffered(
+            client, args.records, args.concurrency, False
+        ),
+    }
+    for name, run in modes.items():
+        client = StubKinesisClient(args.latency_ms / 1000)
+        start = time.perf_counter()
+        latencies = np.array(asyncio.run(run(client))) * 1000
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:<16} calls/record {client.calls / client.records:.4f}"
+            f" {args.records / elapsed:>9.0f} rec/s"
+            f" p50 {np.percentile(latencies, 50):8.2f} ms"
+            f" p99 {np.percentile(latencies, 99):8.2f} ms"
+        )
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from fastapi import FastAPI
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from metrics import MetricsMiddleware, stage  # noqa: E402
+
+
+def bench_stage(iterations):
+    """
+    Measure the cost of one stage() hook against an empty block.
+
+    Args:
+        iterations (int): The number of timed iterations.
+
+    Returns:
+        float: The overhead of a single hook in nanoseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with stage("/bench", "noop"):
+            pass
+    instrumented = time.perf_counter() - start
+
+    return (instrumented - baseline) / iterations * 1e9
+
+
+def build_app(instrumented):
+    """
+    Build a minimal app shaped like the real routers, with or without metrics.
+
+    Args:
+        instrumented (bool): Whether to install the metrics middleware and stage hooks.
+
+    Returns:
+        FastAPI: The application.
+    """
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/bench")
+    async def bench():
+        if instrumented:
+            for name in ("redis_get", "transform", "predict", "response_build"):
+                with stage("/bench", name):
+                    pass
+        return {"result": "ok"}
+
+    return app
+
+
+async def bench_requests(app, requests):
+    """
+    Measure the mean in-process latency of a GET request.
+
+    Args:
+        app (FastAPI): The application under test.
+        requests (int): The number of timed requests.
+
+    Returns:
+        float: The mean request latency in microseconds.
+    """
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for _ in range(100):
+            await client.get("/bench")
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/bench")
+        return (time.perf_counter() - start) / requests * 1e6
+
+
+if __name__ == "__main__":
+    """
+    Benchmark the overhead the metrics instrumentation adds to a request.
+
+    Runs an uninstrumented and an instrumented copy of a minimal app in-process and
+    reports the per-hook cost and the per-request difference.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"stage() hook: {bench_stage(args.iterations):.0f} ns per call")
+
+    # Interleave the two variants and keep the median to cancel out machine noise
+    plain_app, instrumented_app = build_app(False), build_app(True)
+    plain_runs, instrumented_runs = [], []
+    for _ in range(args.rounds):
+        plain_runs.append(asyncio.run(bench_requests(plain_app, args.requests)))
+        instrumented_runs.append(
+            asyncio.run(bench_requests(instrumented_app, args.requests))
+        )
+    plain = statistics.median(plain_runs)
+    instrumented = statistics.median(instrumented_runs)
+    print(f"plain request: {plain:.1f} us")
+    print(
+        f"instrumented request: {instrumented:.1f} us "
+        f"(+{instrumented - plain:.1f} us, {(instrumented / plain - 1) * 100:.1f}%)"
+    )
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+import time
+import boto3
+from moto import mock_aws
+import pandas as pd
+from sqlalchemy import create_engine, func, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from data_schema import Base, TelecomUsers  # noqa: E402
+from stream_consumer import StreamConsumer  # noqa: E402
+
+INPUT_CSV = os.path.join(os.path.dirname(__file__), "..", "input.csv")
+
+
+def put_records(client, stream_name, records):
+    """
+    Write records to the stream the way the ingest endpoint does.
+
+    Args:
+        client (boto3.client): The Kinesis client.
+        stream_name (str): The name of the stream.
+        records (list): The records to write.
+    """
+    for start in range(0, len(records), 500):
+        client.put_records(
+            StreamName=stream_name,
+            Records=[
+                {"Data": json.dumps(record), "PartitionKey": record["customerID"]}
+                for record in records[start : start + 500]
+            ],
+        )
+
+
+if __name__ == "__main__":
+    """
+    Measure how fast the stream consumer loads a backlog and resumes from checkpoints.
+
+    Runs against a moto Kinesis stream and a local database. The stream is filled
+    with input.csv, drained, and the consumer is restarted to check that nothing is
+    applied twice.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///bench_stream.db")
+    parser.add_argument("--shards", type=int, default=2)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+    df = pd.read_csv(INPUT_CSV)
+    df.TotalCharges = pd.to_numeric(df.TotalCharges, errors="coerce")
+    df.dropna(inplace=True)
+    records = df.to_dict(orient="records") * args.copies
+
+    engine = create_engine(args.database_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    with mock_aws():
+        client = boto3.client("kinesis", region_name="us-east-1")
+        client.create_stream(StreamName="bench-stream", ShardCount=args.shards)
+        put_records(client, "bench-stream", records)
+
+        consumer = StreamConsumer(
+            client,
+            engine,
+            stream_name="bench-stream",
+            batch_size=args.batch_size,
+            poll_interval=0,
+        )
+        start = time.perf_counter()
+        consumer.run(max_idle_polls=1)
+        elapsed = time.perf_counter() - start
+
+        with engine.connect() as conn:
+            rows = conn.execute(select(func.count()).select_from(TelecomUsers)).scalar()
+        print(
+            f"Loaded {len(records)} records ({rows} customers) in {elapsed:.2f}s,"
+            f" {len(records) / elapsed:.0f} records/s"
+        )
+
+        put_records(client, "bench-stream", records[:10])
+        restarted = StreamConsumer(
+            client, engine, stream_name="bench-stream", poll_interval=0
+        )
+        restarted.refresh_shards()
+        print(f"Records read after restart: {restarted.poll()} (expected 10)")
@@ -0,0 +1,62 @@
+from airflow import DAG
+from airflow.providers.amazon.aws.operators.eks import EksPodOperator
+from airflow.providers.cncf.kubernetes.secret import Secret
+from datetime import datetime, timedelta
+
+# Define default arguments for the DAG
+default_args = {
+    "owner": "anirudh",
+    "depends_on_past": False,
+    "start_date": datetime(2024, 1, 1),
+    "email_on_failure": False,
+    "email_on_retry": False,
+    "retries": 1,
+    "retry_delay": timedelta(minutes=5),
+}
+
+AWS_CONN_ID = "aws_default"
+# MWAA runs outside of the cluster, EksPodOperator builds its kubeconfig from the
+# execution role, which terraform/mwaa.tf maps to the airflow-pods Role
+CLUSTER_NAME = "data-cluster"
+NAMESPACE = "default"
+REGION = "us-east-1"
+
+# The training job to score with, overridable per run with {"training_job_name": ...}
+TRAINING_JOB_NAME = (
+    "{{ dag_run.conf.get('training_job_name') or var.value.scoring_training_job_name }}"
+)
+# DATABASE_URL comes from the batch-scoring-db Kubernetes Secret created by
+# terraform/mwaa.tf, so the password never goes through a rendered template field.
+# The pod reads S3 with the node role, so it only needs the region
+SECRETS = [Secret("env", "DATABASE_URL", "batch-scoring-db", "DATABASE_URL")]
+ENV_VARS = {"AWS_DEFAULT_REGION": REGION}
+
+# Define the DAG
+dag = DAG(
+    "batch_scoring",
+    default_args=default_args,
+    description="A DAG to score every customer in RDS PostgreSQL with a trained model",
+    schedule_interval="@daily",
+    catchup=False,
+    is_paused_upon_creation=True,
+)
+
+# Runs batch_scoring.py from the app image on EKS. Every DAG run scores the table
+# under its own run id, and a retry of the run resumes from its last completed chunk
+scoring_task = EksPodOperator(
+    task_id="batch_scoring",
+    pod_name="batch-scoring",
+    cluster_name=CLUSTER_NAME,
+    namespace=NAMESPACE,
+    region=REGION,
+    aws_conn_id=AWS_CONN_ID,
+    image="{{ var.value.app_image }}",
+    cmds=["python", "batch_scoring.py"],
+    arguments=["--training-job-name", TRAINING_JOB_NAME, "--run-id", "{{ ds }}"],
+    env_vars=ENV_VARS,
+    secrets=SECRETS,
+    get_logs=True,
+    dag=dag,
+)
+
+scoring_task
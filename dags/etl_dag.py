@@ -2,9 +2,17 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.providers.amazon.aws.hooks.s3 import S3Hook
 from airflow.providers.postgres.hooks.postgres import PostgresHook
+from airflow.providers.redis.hooks.redis import RedisHook
+import base64
 from datetime import datetime, timedelta
 import json
 import logging
+import pandas as pd
+from psycopg2.extras import execute_values
+from churn_stats import SEED_STATS_SQL, STATS_DIMENSIONS, STATS_LOCK_SQL, stats_deltas
+from data_schema import Base
+from feature_cache import FeatureCache
+from record_codec import COMPACT_V1, ENUMS, iter_records
 
 # Define default arguments for the DAG
 default_args = {
@@ -20,6 +28,62 @@ default_args = {
 BUCKET_NAME = "app-stream-data-20240812123628897900000002"
 AWS_CONN_ID = "aws_default"
 POSTGRES_CONN_ID = "rds_default"
+REDIS_CONN_ID = "redis_default"
+CHUNK_SIZE = 5000
+
+COLUMNS = [
+    "customerID",
+    "gender",
+    "SeniorCitizen",
+    "Partner",
+    "Dependents",
+    "tenure",
+    "PhoneService",
+    "MultipleLines",
+    "InternetService",
+    "OnlineSecurity",
+    "OnlineBackup",
+    "DeviceProtection",
+    "TechSupport",
+    "StreamingTV",
+    "StreamingMovies",
+    "Contract",
+    "PaperlessBilling",
+    "PaymentMethod",
+    "MonthlyCharges",
+    "TotalCharges",
+    "Churn",
+]
+INTEGER_COLS = ["SeniorCitizen", "tenure"]
+FLOAT_COLS = ["MonthlyCharges", "TotalCharges"]
+
+# The TelecomUsers enum types only accept these levels
+CATEGORICAL_DOMAINS = ENUMS
+# Upper bound of the smallint integer columns
+SMALLINT_MAX = 32767
+
+UPSERT_QUERY = f"""
+INSERT INTO "TelecomUsers" ({", ".join(f'"{col}"' for col in COLUMNS)})
+VALUES %s
+ON CONFLICT ("customerID") DO UPDATE SET
+{", ".join(f'"{col}" = EXCLUDED."{col}"' for col in COLUMNS[1:])};
+"""
+
+QUARANTINE_QUERY = """
+INSERT INTO "TelecomUsersQuarantine" ("customerID", "record", "reason") VALUES %s;
+"""
+
+SELECT_STATS_ROWS_QUERY = f"""
+SELECT {", ".join(f'"{col}"' for col in STATS_DIMENSIONS + ["Churn"])}
+FROM "TelecomUsers" WHERE "customerID" = ANY(%s);
+"""
+
+STATS_DELTA_QUERY = """
+INSERT INTO "ChurnStats" ("dimension", "value", "customers", "churned") VALUES %s
+ON CONFLICT ("dimension", "value") DO UPDATE SET
+"customers" = "ChurnStats"."customers" + EXCLUDED."customers",
+"churned" = "ChurnStats"."churned" + EXCLUDED."churned";
+"""
 
 # Define the DAG
 dag = DAG(
@@ -60,12 +124,166 @@ def list_keys_recursive(s3_hook, bucket, prefix=""):
     return keys
 
 
+def apply_stats_deltas(cursor, valid):
+    """
+    Update ChurnStats for a chunk of rows about to be upserted into TelecomUsers.
+
+    Must run in the transaction of the upsert. The ChurnStats lock shared with the
+    stream consumer is taken first, so concurrent writers cannot apply the same
+    delta twice, see churn_stats.
+
+    Args:
+        cursor (cursor): An open psycopg2 cursor.
+        valid (pd.DataFrame): The validated rows of the chunk.
+    """
+    cursor.execute(STATS_LOCK_SQL)
+    cursor.execute(SELECT_STATS_ROWS_QUERY, (valid["customerID"].tolist(),))
+    columns = STATS_DIMENSIONS + ["Churn"]
+    before = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    deltas = stats_deltas(before, valid[columns].to_dict(orient="records"))
+    if deltas:
+        execute_values(
+            cursor,
+            STATS_DELTA_QUERY,
+            [
+                (dimension, value, delta[0], delta[1])
+                for (dimension, value), delta in deltas.items()
+            ],
+            page_size=CHUNK_SIZE,
+        )
+
+
+def validate_records(df):
+    """
+    Validate and coerce a chunk of parsed records column by column.
+
+    Every check runs over whole columns, so the cost per chunk is a handful of
+    vectorized pandas operations instead of one Python-level check per field.
+    Numeric fields are coerced with pd.to_numeric and categorical fields are
+    checked against their enum domains.
+
+    Args:
+        df (pd.DataFrame): The parsed records, one column per field.
+
+    Returns:
+        tuple: A (valid, invalid) pair of DataFrames. valid holds typed rows ready
+        to upsert, deduplicated on customerID. invalid holds the rejected rows with
+        a "reason" column listing the failing fields.
+    """
+    df = df.reindex(columns=COLUMNS)
+    errors = pd.DataFrame(index=df.index)
+
+    errors["customerID"] = df["customerID"].isna() | (
+        df["customerID"].astype(str).str.strip() == ""
+    )
+
+    for col, domain in CATEGORICAL_DOMAINS.items():
+        errors[col] = ~df[col].isin(domain)
+
+    numeric = {}
+    for col in INTEGER_COLS + FLOAT_COLS:
+        numeric[col] = pd.to_numeric(df[col], errors="coerce")
+        errors[col] = numeric[col].isna() | (numeric[col] < 0)
+    for col in INTEGER_COLS:
+        errors[col] |= (numeric[col] % 1 != 0) | (numeric[col] > SMALLINT_MAX)
+    errors["SeniorCitizen"] |= ~numeric["SeniorCitizen"].isin([0, 1])
+
+    invalid_mask = errors.any(axis=1)
+    invalid = df[invalid_mask].copy()
+    invalid["reason"] = errors[invalid_mask].dot(errors.columns + ",").str.rstrip(",")
+
+    valid = df[~invalid_mask].copy()
+    for col in INTEGER_COLS:
+        valid[col] = numeric[col][~invalid_mask].astype("int64")
+    for col in FLOAT_COLS:
+        valid[col] = numeric[col][~invalid_mask].astype("float64")
+    # A multi-row upsert cannot touch the same key twice, keep the latest record
+    valid = valid.drop_duplicates(subset="customerID", keep="last")
+
+    return valid, invalid
+
+
+def parse_records(data):
+    """
+    Split a Firehose object of concatenated records into parsed records.
+
+    Records may be JSON documents or compact binary records, see record_codec.
+
+    Args:
+        data (bytes): The object body.
+
+    Returns:
+        tuple: A (records, malformed) pair. records is a list of dicts and malformed
+        is a list of raw strings that could not be parsed.
+    """
+    records, malformed = [], []
+    for record, raw in iter_records(data):
+        if record is not None:
+            records.append(record)
+        elif raw[:1] == bytes([COMPACT_V1]):
+            # Binary cannot go into a TEXT column as is
+            malformed.append("compact:" + base64.b64encode(raw).decode())
+        else:
+            malformed.append(raw.decode("utf-8", errors="replace").replace("\x00", ""))
+    return records, malformed
+
+
+def store_chunk(cursor, records):
+    """
+    Validate a chunk of records and write it to RDS PostgreSQL in bulk.
+
+    Valid rows are upserted into TelecomUsers and invalid rows are inserted into
+    TelecomUsersQuarantine, each with a single multi-row statement. The ChurnStats
+    aggregates are updated with the before/after deltas of the upserted rows.
+
+    Args:
+        cursor (cursor): An open psycopg2 cursor.
+        records (list): The parsed records of the chunk.
+
+    Returns:
+        tuple: The customerIDs of the upserted rows and the number of quarantined rows.
+    """
+    valid, invalid = validate_records(pd.DataFrame.from_records(records))
+
+    if not valid.empty:
+        apply_stats_deltas(cursor, valid)
+        execute_values(
+            cursor,
+            UPSERT_QUERY,
+            valid[COLUMNS].astype(object).values.tolist(),
+            page_size=CHUNK_SIZE,
+        )
+    if not invalid.empty:
+        quarantine(cursor, invalid)
+
+    return valid["customerID"].tolist(), len(invalid)
+
+
+def quarantine(cursor, invalid):
+    """
+    Insert rejected records into the TelecomUsersQuarantine table in bulk.
+
+    Args:
+        cursor (cursor): An open psycopg2 cursor.
+        invalid (pd.DataFrame): The rejected rows with a "reason" column.
+    """
+    records = invalid.drop(columns="reason").astype(object)
+    records = records.where(records.notna(), None).to_dict(orient="records")
+    rows = [
+        (record["customerID"], json.dumps(record, default=str), reason)
+        for record, reason in zip(records, invalid["reason"])
+    ]
+    execute_values(cursor, QUARANTINE_QUERY, rows, page_size=CHUNK_SIZE)
+
+
 def read_transform_store_data(**kwargs):
     """
     Read data from S3, transform it, and store it in RDS PostgreSQL.
 
-    This function reads JSON data from S3, transforms it, and upserts it into
-    the TelecomUsers table in RDS PostgreSQL.
+    This function reads JSON data from S3, validates it in chunks, upserts the valid
+    records into the TelecomUsers table in RDS PostgreSQL and moves the invalid ones
+    to the TelecomUsersQuarantine table. The cached feature vectors of the upserted
+    customers are invalidated, whether or not the API has the feature cache enabled.
 
     Args:
         kwargs (dict): Additional keyword arguments passed by Airflow.
@@ -75,81 +293,45 @@ def read_transform_store_data(**kwargs):
 
     logging.info(f"Found {len(keys)} objects in the S3 bucket")
     all_records = []
+    all_malformed = []
 
     for key in keys:
         obj = s3_hook.get_key(key, BUCKET_NAME)
-        data = obj.get()["Body"].read().decode("utf-8")
-
-        # Split the data into individual JSON objects
-        records = data.split("}{")
-        records = [
-            record + "}" if not record.endswith("}") else record for record in records
-        ]
-        records = [
-            "{" + record if not record.startswith("{") else record for record in records
-        ]
+        data = obj.get()["Body"].read()
 
         # Collect all records
+        records, malformed = parse_records(data)
         all_records.extend(records)
+        all_malformed.extend(malformed)
 
     pg_hook = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID)
+    # Normally created by the app already, the tables are defined in data_schema
+    Base.metadata.create_all(pg_hook.get_sqlalchemy_engine(), checkfirst=True)
     conn = pg_hook.get_conn()
     cursor = conn.cursor()
+    cursor.execute(SEED_STATS_SQL)
 
-    for record in all_records:
-        json_data = json.loads(record)
-        upsert_query = """
-        INSERT INTO "TelecomUsers" ("customerID", "gender", "SeniorCitizen", "Partner", "Dependents", "tenure", "PhoneService", "MultipleLines", "InternetService", "OnlineSecurity", "OnlineBackup", "DeviceProtection", "TechSupport", "StreamingTV", "StreamingMovies", "Contract", "PaperlessBilling", "PaymentMethod", "MonthlyCharges", "TotalCharges", "Churn")
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT ("customerID") DO UPDATE SET
-        "gender" = EXCLUDED."gender",
-        "SeniorCitizen" = EXCLUDED."SeniorCitizen",
-        "Partner" = EXCLUDED."Partner",
-        "Dependents" = EXCLUDED."Dependents",
-        "tenure" = EXCLUDED."tenure",
-        "PhoneService" = EXCLUDED."PhoneService",
-        "MultipleLines" = EXCLUDED."MultipleLines",
-        "InternetService" = EXCLUDED."InternetService",
-        "OnlineSecurity" = EXCLUDED."OnlineSecurity",
-        "OnlineBackup" = EXCLUDED."OnlineBackup",
-        "DeviceProtection" = EXCLUDED."DeviceProtection",
-        "TechSupport" = EXCLUDED."TechSupport",
-        "StreamingTV" = EXCLUDED."StreamingTV",
-        "StreamingMovies" = EXCLUDED."StreamingMovies",
-        "Contract" = EXCLUDED."Contract",
-        "PaperlessBilling" = EXCLUDED."PaperlessBilling",
-        "PaymentMethod" = EXCLUDED."PaymentMethod",
-        "MonthlyCharges" = EXCLUDED."MonthlyCharges",
-        "TotalCharges" = EXCLUDED."TotalCharges",
-        "Churn" = EXCLUDED."Churn";
-        """
-        cursor.execute(
-            upsert_query,
-            (
-                json_data["customerID"],
-                json_data["gender"],
-                json_data["SeniorCitizen"],
-                json_data["Partner"],
-                json_data["Dependents"],
-                json_data["tenure"],
-                json_data["PhoneService"],
-                json_data["MultipleLines"],
-                json_data["InternetService"],
-                json_data["OnlineSecurity"],
-                json_data["OnlineBackup"],
-                json_data["DeviceProtection"],
-                json_data["TechSupport"],
-                json_data["StreamingTV"],
-                json_data["StreamingMovies"],
-                json_data["Contract"],
-                json_data["PaperlessBilling"],
-                json_data["PaymentMethod"],
-                json_data["MonthlyCharges"],
-                json_data["TotalCharges"],
-                json_data["Churn"],
-            ),
+    if all_malformed:
+        execute_values(
+            cursor,
+            QUARANTINE_QUERY,
+            [(None, record, "malformed") for record in all_malformed],
+            page_size=CHUNK_SIZE,
+        )
+
+    feature_cache = FeatureCache(RedisHook(redis_conn_id=REDIS_CONN_ID).get_conn())
+    upserted, quarantined = 0, len(all_malformed)
+    for start in range(0, len(all_records), CHUNK_SIZE):
+        upserted_ids, chunk_quarantined = store_chunk(
+            cursor, all_records[start : start + CHUNK_SIZE]
         )
         conn.commit()
+        feature_cache.invalidate(upserted_ids)
+        upserted += len(upserted_ids)
+        quarantined += chunk_quarantined
+
+    conn.commit()
+    logging.info(f"Upserted {upserted} records, quarantined {quarantined} records")
 
     cursor.close()
     conn.close()
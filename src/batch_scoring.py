@@ -0,0 +1,312 @@
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import io
+import logging
+import os
+import time
+import boto3
+import joblib
+import pandas as pd
+from sqlalchemy import create_engine, delete, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from constants import DATABASE_URL
+from data_schema import Base, Prediction, ScoringCheckpoint
+from model_store import download_artifacts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREDICTION_COLUMNS = [
+    "training_job_name",
+    "run_id",
+    "customerID",
+    "Churn",
+    "churn_probability",
+    "scored_at",
+]
+COPY_QUERY = (
+    'COPY "predictions" ('
+    + ", ".join(f'"{column}"' for column in PREDICTION_COLUMNS)
+    + ") FROM STDIN WITH (FORMAT csv)"
+)
+CHUNK_QUERY = text(
+    'SELECT * FROM "TelecomUsers" WHERE "customerID" > :last_customer_id '
+    'ORDER BY "customerID" LIMIT :chunk_size'
+)
+
+_model = None
+_transformer = None
+
+
+def init_worker(model_bytes, transformer_bytes):
+    """
+    Deserialize the model and transformer once per worker process.
+
+    Args:
+        model_bytes (bytes): The joblib serialized model.
+        transformer_bytes (bytes): The joblib serialized transformer.
+    """
+    global _model, _transformer
+    _model = joblib.load(io.BytesIO(model_bytes))
+    _transformer = joblib.load(io.BytesIO(transformer_bytes))
+
+
+def score_chunk(df):
+    """
+    Transform and predict a chunk of customers in a worker process.
+
+    Args:
+        df (pd.DataFrame): The TelecomUsers rows of the chunk.
+
+    Returns:
+        pd.DataFrame: The customerID, predicted Churn label and churn probability of every row.
+    """
+    X = _transformer.transform(df)
+    probabilities = _model.predict_proba(X)
+    classes = list(_model.classes_)
+    return pd.DataFrame(
+        {
+            "customerID": df["customerID"].values,
+            "Churn": _model.classes_[probabilities.argmax(axis=1)],
+            "churn_probability": probabilities[:, classes.index("Yes")],
+        }
+    )
+
+
+class BatchScorer:
+    """
+    Score the whole TelecomUsers table with the model of a training job.
+
+    The table is read in customerID order with keyset pagination, so every chunk is
+    an index range scan and memory stays flat. Chunks are scored in a process pool
+    with a bounded number in flight, and their results are committed in order. Each
+    chunk's predictions and checkpoint go in one transaction, so an interrupted run
+    resumes after the last completed chunk. Predictions and checkpoints are keyed by
+    run, so every scheduled run scores the table again while a retry of the same run
+    resumes it. Once a run finishes, the predictions of earlier runs are deleted.
+
+    Attributes:
+        engine (Engine): The SQLAlchemy engine of the database.
+        training_job_name (str): The training job whose model is used.
+        run_id (str): The identifier of the run, run ids must sort chronologically.
+        chunk_size (int): The number of customers per chunk.
+        workers (int): The number of worker processes.
+    """
+
+    def __init__(
+        self, engine, training_job_name, run_id, chunk_size=50000, workers=None
+    ):
+        self.engine = engine
+        self.training_job_name = training_job_name
+        self.run_id = run_id
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        # SQLite is supported so the job can run against local stand-ins
+        self._insert = (
+            postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+        )
+
+    def load_checkpoint(self):
+        """
+        Load the checkpoint of the run.
+
+        Returns:
+            Row: The ScoringCheckpoint row, or None if the run has not scored a chunk.
+        """
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(ScoringCheckpoint).where(
+                    ScoringCheckpoint.training_job_name == self.training_job_name,
+                    ScoringCheckpoint.run_id == self.run_id,
+                )
+            ).first()
+
+    def reset(self):
+        """
+        Delete the predictions and checkpoint of the run.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(Prediction).where(
+                    Prediction.training_job_name == self.training_job_name,
+                    Prediction.run_id == self.run_id,
+                )
+            )
+            conn.execute(
+                delete(ScoringCheckpoint).where(
+                    ScoringCheckpoint.training_job_name == self.training_job_name,
+                    ScoringCheckpoint.run_id == self.run_id,
+                )
+            )
+
+    def prune(self):
+        """
+        Delete the predictions and checkpoints of the earlier runs of the training job.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(
+                delete(Prediction).where(
+                    Prediction.training_job_name == self.training_job_name,
+                    Prediction.run_id < self.run_id,
+                )
+            )
+            conn.execute(
+                delete(ScoringCheckpoint).where(
+                    ScoringCheckpoint.training_job_name == self.training_job_name,
+                    ScoringCheckpoint.run_id < self.run_id,
+                )
+            )
+
+    def read_chunks(self, last_customer_id):
+        """
+        Read TelecomUsers in customerID order, one chunk at a time.
+
+        Args:
+            last_customer_id (str): Only customers after this identifier are read.
+
+        Yields:
+            pd.DataFrame: The next chunk of rows.
+        """
+        while True:
+            with self.engine.connect() as conn:
+                df = pd.read_sql(
+                    CHUNK_QUERY,
+                    conn,
+                    params={
+                        "last_customer_id": last_customer_id,
+                        "chunk_size": self.chunk_size,
+                    },
+                )
+            if df.empty:
+                return
+            yield df
+            last_customer_id = df["customerID"].iloc[-1]
+
+    def write_chunk(self, predictions, rows_scored, finished=False):
+        """
+        Store the predictions of a chunk and advance the checkpoint in one transaction.
+
+        Args:
+            predictions (pd.DataFrame): The predictions of the chunk.
+            rows_scored (int): The number of customers scored including this chunk.
+            finished (bool): Whether this is the last chunk.
+        """
+        now = datetime.now()
+        predictions = predictions.assign(
+            training_job_name=self.training_job_name, run_id=self.run_id, scored_at=now
+        )[PREDICTION_COLUMNS]
+        checkpoint = {
+            "training_job_name": self.training_job_name,
+            "run_id": self.run_id,
+            "last_customer_id": predictions["customerID"].iloc[-1],
+            "rows_scored": rows_scored,
+            "finished": finished,
+            "updated_at": now,
+        }
+
+        with self.engine.begin() as conn:
+            if self.engine.dialect.name == "postgresql":
+                buffer = io.StringIO()
+                predictions.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor = conn.connection.cursor()
+                cursor.copy_expert(COPY_QUERY, buffer)
+            else:
+                conn.execute(insert(Prediction), predictions.to_dict(orient="records"))
+
+            stmt = self._insert(ScoringCheckpoint).values(**checkpoint)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["training_job_name", "run_id"],
+                set_={
+                    key: value
+                    for key, value in checkpoint.items()
+                    if key not in ("training_job_name", "run_id")
+                },
+            )
+            conn.execute(stmt)
+
+    def run(self, artifacts):
+        """
+        Score every customer not covered by the checkpoint of the run.
+
+        Args:
+            artifacts (dict): The joblib bytes of model.joblib and transformer.joblib.
+
+        Returns:
+            int: The total number of customers scored in the run.
+        """
+        checkpoint = self.load_checkpoint()
+        if checkpoint is not None and checkpoint.finished:
+            logger.info(
+                f"Run {self.run_id} of {self.training_job_name} is already scored,"
+                " use --restart"
+            )
+            self.prune()
+            return checkpoint.rows_scored
+
+        last_customer_id = checkpoint.last_customer_id if checkpoint else ""
+        rows_scored = checkpoint.rows_scored if checkpoint else 0
+        if checkpoint is not None:
+            logger.info(f"Resuming after customer {last_customer_id}")
+
+        start = time.perf_counter()
+        in_flight = deque()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker,
+            initargs=(artifacts["model.joblib"], artifacts["transformer.joblib"]),
+        ) as executor:
+            for df in self.read_chunks(last_customer_id):
+                in_flight.append(executor.submit(score_chunk, df))
+                # Bound the chunks held in memory, and commit them in table order
+                if len(in_flight) > self.workers:
+                    predictions = in_flight.popleft().result()
+                    rows_scored += len(predictions)
+                    self.write_chunk(predictions, rows_scored)
+            while in_flight:
+                predictions = in_flight.popleft().result()
+                rows_scored += len(predictions)
+                self.write_chunk(predictions, rows_scored, finished=not in_flight)
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Scored {rows_scored} customers with {self.training_job_name} in {elapsed:.1f}s"
+        )
+        self.prune()
+        return rows_scored
+
+
+if __name__ == "__main__":
+    """
+    Score every customer in TelecomUsers with the model of a training job.
+
+    Predictions are written to the predictions table under --run-id, today's date by
+    default. Rerunning an interrupted run resumes from its last completed chunk,
+    --restart scores everything again.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--training-job-name", required=True)
+    parser.add_argument("--run-id", default=date.today().isoformat())
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    Base.metadata.create_all(engine, checkfirst=True)
+    scorer = BatchScorer(
+        engine,
+        args.training_job_name,
+        args.run_id,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+    )
+    if args.restart:
+        scorer.reset()
+
+    artifacts = download_artifacts(
+        boto3.client("s3", region_name="us-east-1"), args.training_job_name
+    )
+    scorer.run(artifacts)
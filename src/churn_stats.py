@@ -0,0 +1,128 @@
+from collections import defaultdict
+from sqlalchemy import select, text
+from data_schema import ChurnStats, TelecomUsers
+
+# Shared by the app and the s3_to_rds DAG, which receives this module next to its
+# own file, so everything but apply_stats_deltas is plain Python and SQL
+STATS_DIMENSIONS = ["Contract", "InternetService", "PaymentMethod", "tenure"]
+# Upper bound (inclusive) and label of every tenure bucket, in months
+TENURE_BUCKETS = [(12, "0-12"), (24, "13-24"), (48, "25-48"), (72, "49-72")]
+TENURE_OVERFLOW_BUCKET = "73+"
+# Key of the transaction-level advisory lock every writer of TelecomUsers takes
+# before reading the previous versions of its rows. Row locks cannot cover
+# customers that do not exist yet, so two writers inserting the same new customer
+# would both count it. The writers already contend on the ChurnStats rows, so
+# serializing them costs little.
+STATS_LOCK_ID = 20240812
+STATS_LOCK_SQL = f"SELECT pg_advisory_xact_lock({STATS_LOCK_ID})"
+
+
+def _seed_stats_sql():
+    tenure_case = " ".join(
+        f"WHEN \"tenure\" <= {upper} THEN '{label}'" for upper, label in TENURE_BUCKETS
+    )
+    selects = []
+    for dimension in STATS_DIMENSIONS:
+        if dimension == "tenure":
+            value = f"CASE {tenure_case} ELSE '{TENURE_OVERFLOW_BUCKET}' END"
+        else:
+            # The dimensions are different enum types, which UNION ALL cannot mix
+            value = f'CAST("{dimension}" AS VARCHAR)'
+        selects.append(
+            f"""SELECT '{dimension}' AS "dimension", {value} AS "value", """
+            """COUNT(*) AS "customers", """
+            """SUM(CASE WHEN "Churn" = 'Yes' THEN 1 ELSE 0 END) AS "churned" """
+            """FROM "TelecomUsers" GROUP BY 2"""
+        )
+    return (
+        """INSERT INTO "ChurnStats" ("dimension", "value", "customers", "churned") """
+        f"""SELECT * FROM ({" UNION ALL ".join(selects)}) AS stats """
+        """WHERE NOT EXISTS (SELECT 1 FROM "ChurnStats")"""
+    )
+
+
+# Builds ChurnStats from the current TelecomUsers rows, only while it is still empty
+SEED_STATS_SQL = _seed_stats_sql()
+SEED_STATS_QUERY = text(SEED_STATS_SQL)
+
+
+def tenure_bucket(tenure):
+    """
+    Map a tenure in months to its bucket label.
+
+    Args:
+        tenure (int): The number of months the customer has stayed with the company.
+
+    Returns:
+        str: The bucket label.
+    """
+    for upper, label in TENURE_BUCKETS:
+        if tenure <= upper:
+            return label
+    return TENURE_OVERFLOW_BUCKET
+
+
+def stats_deltas(before, after):
+    """
+    Compute the ChurnStats changes caused by replacing rows.
+
+    Args:
+        before (list): The previous versions of the changed rows, as dicts.
+        after (list): The new versions of the changed rows, as dicts.
+
+    Returns:
+        dict: [customers, churned] deltas keyed by (dimension, value), without zero entries.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for rows, sign in ((before, -1), (after, 1)):
+        for row in rows:
+            churned = sign if row["Churn"] == "Yes" else 0
+            for dimension in STATS_DIMENSIONS:
+                value = row[dimension]
+                if dimension == "tenure":
+                    value = tenure_bucket(value)
+                delta = deltas[(dimension, value)]
+                delta[0] += sign
+                delta[1] += churned
+    return {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+
+
+def apply_stats_deltas(conn, insert, rows):
+    """
+    Update ChurnStats for rows about to be upserted into TelecomUsers.
+
+    Must run in the transaction of the upsert. On Postgres the STATS_LOCK_ID lock is
+    taken first, so concurrent writers cannot apply the same delta twice. SQLite
+    serializes writers itself.
+
+    Args:
+        conn (Connection): The open SQLAlchemy connection.
+        insert (callable): The dialect specific insert construct supporting on_conflict_do_update.
+        rows (list): The new versions of the rows, as dicts.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(STATS_LOCK_SQL))
+    columns = [getattr(TelecomUsers, column) for column in STATS_DIMENSIONS + ["Churn"]]
+    before = conn.execute(
+        select(*columns).where(
+            TelecomUsers.customerID.in_([row["customerID"] for row in rows])
+        )
+    )
+    deltas = stats_deltas([row._asdict() for row in before], rows)
+    if not deltas:
+        return
+
+    stmt = insert(ChurnStats).values(
+        [
+            {"dimension": dimension, "value": value, "customers": d[0], "churned": d[1]}
+            for (dimension, value), d in deltas.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["dimension", "value"],
+        set_={
+            "customers": ChurnStats.customers + stmt.excluded.customers,
+            "churned": ChurnStats.churned + stmt.excluded.churned,
+        },
+    )
+    conn.execute(stmt)
@@ -1,4 +1,14 @@
+import os
+
 STREAM_NAME = "app-stream"
+# Format of the records written to the stream, "json" or "compact", see record_codec.py.
+# Only switch to "compact" once every consumer of the stream can decode it.
+STREAM_RECORD_ENCODING = os.environ.get("STREAM_RECORD_ENCODING", "json")
+# Opt-in buffered Kinesis producer for /data/ingest, see kinesis_producer.py
+KINESIS_BUFFERED_PRODUCER = os.environ.get("KINESIS_BUFFERED_PRODUCER") == "1"
+KINESIS_BATCH_SIZE = int(os.environ.get("KINESIS_BATCH_SIZE", 500))
+KINESIS_MAX_BATCH_AGE = float(os.environ.get("KINESIS_MAX_BATCH_AGE", 0.05))
+KINESIS_BUFFER_SIZE = int(os.environ.get("KINESIS_BUFFER_SIZE", 10000))
 REDIS_HOST = "my-redis-cluster.wahhz8.0001.use1.cache.amazonaws.com"
 REDIS_PORT = 6379
 DB_HOST = (
@@ -8,8 +18,29 @@ DB_PORT = 5432
 DB_NAME = "data_db"
 DB_USER = "postgres"
 DB_PASSWORD = "password"
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+)
 
 SQS_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/765826404413/training-queue"
 MODEL_BUCKET_NAME = "model-bucket-20240826061620914100000001"
 REDIS_CACHE_PREFIX = "model_cache:"
+MODEL_CACHE_TTL = int(os.environ.get("MODEL_CACHE_TTL", 7 * 24 * 3600))
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Opt-in cache of transformed feature vectors for /model/inference/customers, see
+# feature_cache.py. The ETL and the stream consumer always invalidate the rows they
+# change, so it only needs to be set for the API.
+FEATURE_CACHE = os.environ.get("FEATURE_CACHE") == "1"
+FEATURE_CACHE_TTL = int(os.environ.get("FEATURE_CACHE_TTL", 24 * 3600))
+# Models loaded by the gunicorn master before forking, see gunicorn.conf.py
+PRELOAD_MODELS = [
+    name for name in os.environ.get("PRELOAD_MODELS", "").split(",") if name
+]
+# Opt-in request profiling, see profiling.py. Requests are profiled when their
+# X-Profile header carries PROFILING_TOKEN, or at random with PROFILING_SAMPLE_RATE.
+PROFILING = os.environ.get("PROFILING") == "1"
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILE_PREFIX = "profiles:"
+PROFILE_TTL = int(os.environ.get("PROFILE_TTL", 24 * 3600))
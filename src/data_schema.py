@@ -1,7 +1,19 @@
-from typing import List, Optional, Union
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, model_validator
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    Integer,
+    SmallInteger,
+    String,
+    Text,
+    func,
+)
+from record_codec import ENUMS, INTERNET_ADDON, YES_NO
 
 
 class UserData(BaseModel):
@@ -66,6 +78,12 @@ class ChurnData(UserData):
 
 Base = declarative_base()
 
+# Categorical columns are native Postgres enums, 4 bytes per value instead of the
+# label. Columns with the same levels share a type. The levels come from the stream
+# record codec, and like there, new levels must only be appended.
+YES_NO_ENUM = Enum(*YES_NO, name="yes_no")
+INTERNET_ADDON_ENUM = Enum(*INTERNET_ADDON, name="internet_addon")
+
 
 class TelecomUsers(Base):
     """
@@ -94,30 +112,153 @@ class TelecomUsers(Base):
         MonthlyCharges (Column): The amount charged to the customer monthly.
         TotalCharges (Column): The total amount charged to the customer.
         Churn (Column): Whether the customer churned or not (Yes or No).
+
+    Categorical columns are enums and the integer columns are smallints, which keeps
+    rows small for scans and exports. Enums read and compare as their labels, so
+    queries and results are unchanged. customerID is the only filtered column and
+    the primary key indexes it.
     """
 
     __tablename__ = "TelecomUsers"
-    customerID = Column(String, primary_key=True, index=True)
-    gender = Column(String, index=True)
-    SeniorCitizen = Column(Integer)
-    Partner = Column(String)
-    Dependents = Column(String)
-    tenure = Column(Integer)
-    PhoneService = Column(String)
-    MultipleLines = Column(String)
-    InternetService = Column(String)
-    OnlineSecurity = Column(String)
-    OnlineBackup = Column(String)
-    DeviceProtection = Column(String)
-    TechSupport = Column(String)
-    StreamingTV = Column(String)
-    StreamingMovies = Column(String)
-    Contract = Column(String)
-    PaperlessBilling = Column(String)
-    PaymentMethod = Column(String)
+    customerID = Column(String, primary_key=True)
+    gender = Column(Enum(*ENUMS["gender"], name="gender"))
+    SeniorCitizen = Column(SmallInteger)
+    Partner = Column(YES_NO_ENUM)
+    Dependents = Column(YES_NO_ENUM)
+    tenure = Column(SmallInteger)
+    PhoneService = Column(YES_NO_ENUM)
+    MultipleLines = Column(Enum(*ENUMS["MultipleLines"], name="multiple_lines"))
+    InternetService = Column(Enum(*ENUMS["InternetService"], name="internet_service"))
+    OnlineSecurity = Column(INTERNET_ADDON_ENUM)
+    OnlineBackup = Column(INTERNET_ADDON_ENUM)
+    DeviceProtection = Column(INTERNET_ADDON_ENUM)
+    TechSupport = Column(INTERNET_ADDON_ENUM)
+    StreamingTV = Column(INTERNET_ADDON_ENUM)
+    StreamingMovies = Column(INTERNET_ADDON_ENUM)
+    Contract = Column(Enum(*ENUMS["Contract"], name="contract"))
+    PaperlessBilling = Column(YES_NO_ENUM)
+    PaymentMethod = Column(Enum(*ENUMS["PaymentMethod"], name="payment_method"))
     MonthlyCharges = Column(Float)
     TotalCharges = Column(Float)
+    Churn = Column(YES_NO_ENUM)
+
+
+class QuarantinedRecord(Base):
+    """
+    SQLAlchemy model for the TelecomUsersQuarantine table.
+
+    Holds the records the s3_to_rds DAG rejected, with the fields that failed
+    validation, so they can be inspected and replayed.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        id (Column): The identifier of the quarantined record, primary key.
+        customerID (Column): The customerID of the record, None if it could not be parsed.
+        record (Column): The record as JSON, or its raw text if it could not be parsed.
+        reason (Column): The comma-separated failing fields, or "malformed".
+        quarantined_at (Column): When the record was quarantined.
+    """
+
+    __tablename__ = "TelecomUsersQuarantine"
+    id = Column(Integer, primary_key=True)
+    customerID = Column(String)
+    record = Column(Text)
+    reason = Column(String)
+    quarantined_at = Column(DateTime, server_default=func.now())
+
+
+class StreamCheckpoint(Base):
+    """
+    SQLAlchemy model for the StreamCheckpoints table.
+
+    Stores the last sequence number applied to TelecomUsers for every shard of a
+    Kinesis stream. It is written in the same transaction as the upserted records.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        stream_name (Column): The name of the Kinesis stream, part of the primary key.
+        shard_id (Column): The shard identifier, part of the primary key.
+        sequence_number (Column): The sequence number of the last applied record.
+        finished (Column): Whether the shard was closed and fully consumed.
+    """
+
+    __tablename__ = "StreamCheckpoints"
+    stream_name = Column(String, primary_key=True)
+    shard_id = Column(String, primary_key=True)
+    sequence_number = Column(String)
+    finished = Column(Boolean, default=False)
+
+
+class ChurnStats(Base):
+    """
+    SQLAlchemy model for the ChurnStats table.
+
+    Holds the number of customers and churned customers for every value of the
+    dimensions analysts group by. The table is maintained incrementally by every
+    writer of TelecomUsers, which applies the before/after deltas of the rows it changes.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        dimension (Column): The grouped column (Contract, InternetService, PaymentMethod or tenure), part of the primary key.
+        value (Column): The value of the dimension, a tenure bucket for tenure, part of the primary key.
+        customers (Column): The number of customers with this value.
+        churned (Column): The number of those customers who churned.
+    """
+
+    __tablename__ = "ChurnStats"
+    dimension = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    customers = Column(Integer, default=0)
+    churned = Column(Integer, default=0)
+
+
+class Prediction(Base):
+    """
+    SQLAlchemy model for the predictions table written by the batch scoring job.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        training_job_name (Column): The training job whose model made the prediction, part of the primary key.
+        run_id (Column): The scoring run, usually its date, part of the primary key.
+        customerID (Column): The unique identifier of the customer, part of the primary key.
+        Churn (Column): The predicted churn label (Yes or No).
+        churn_probability (Column): The predicted probability of churn.
+        scored_at (Column): When the prediction was made.
+    """
+
+    __tablename__ = "predictions"
+    training_job_name = Column(String, primary_key=True)
+    run_id = Column(String, primary_key=True)
+    customerID = Column(String, primary_key=True)
     Churn = Column(String)
+    churn_probability = Column(Float)
+    scored_at = Column(DateTime)
+
+
+class ScoringCheckpoint(Base):
+    """
+    SQLAlchemy model for the ScoringCheckpoints table.
+
+    Records how far a run of the batch scoring job got for a training job. It is
+    written in the same transaction as the predictions of every chunk.
+
+    Attributes:
+        __tablename__ (str): The name of the table in the database.
+        training_job_name (Column): The training job being scored, part of the primary key.
+        run_id (Column): The scoring run, usually its date, part of the primary key.
+        last_customer_id (Column): The last customerID of the last completed chunk.
+        rows_scored (Column): The number of customers scored so far.
+        finished (Column): Whether the whole table was scored.
+        updated_at (Column): When the checkpoint was last written.
+    """
+
+    __tablename__ = "ScoringCheckpoints"
+    training_job_name = Column(String, primary_key=True)
+    run_id = Column(String, primary_key=True)
+    last_customer_id = Column(String)
+    rows_scored = Column(Integer, default=0)
+    finished = Column(Boolean, default=False)
+    updated_at = Column(DateTime)
 
 
 class ResponseModel(BaseModel):
@@ -141,9 +282,13 @@ class TrainRequest(BaseModel):
 
     Attributes:
         s3_path (Optional[Union[str, None]]): The S3 path to the training data.
+        encoding (str): The categorical feature encoding used by the trainer ("onehot" or "compact").
+        chunk_size (Optional[int]): Train out of core in chunks of this many rows, in memory when None.
     """
 
     s3_path: Optional[Union[str, None]] = None
+    encoding: Literal["onehot", "compact"] = "onehot"
+    chunk_size: Optional[int] = None
 
 
 class TrainResponse(BaseModel):
@@ -183,21 +328,77 @@ class InferenceRequest(BaseModel):
     """
     Request model for making inferences.
 
+    Exactly one of training_job_name and training_job_names must be given.
+
     Attributes:
-        training_job_name (str): The name of the training job to use for inference.
+        training_job_name (Optional[str]): The name of the training job to use for inference.
+        training_job_names (Optional[List[str]]): The names of several training jobs to compare, the first one is the champion.
         input_data (List[UserData]): The input data for which to make predictions.
     """
 
-    training_job_name: str
+    training_job_name: Optional[str] = None
+    training_job_names: Optional[List[str]] = None
     input_data: List[UserData]
 
+    @model_validator(mode="after")
+    def check_training_jobs(self):
+        """
+        Require exactly one of training_job_name and training_job_names.
+        """
+        if (self.training_job_name is None) == (not self.training_job_names):
+            raise ValueError(
+                "Either training_job_name or a non-empty training_job_names is required"
+            )
+        return self
+
 
 class InferenceResponse(BaseModel):
     """
     Response model for inference results.
 
     Attributes:
-        prediction (List[ChurnData]): The predictions made by the model.
+        prediction (List[ChurnData]): The predictions made by the model, or by the first model of training_job_names.
+        predictions (Optional[Dict[str, List[str]]]): The Churn predictions of every model keyed by training job name, only set for training_job_names.
     """
 
     prediction: List[ChurnData]
+    predictions: Optional[Dict[str, List[str]]] = None
+
+
+class CustomerInferenceRequest(BaseModel):
+    """
+    Request model for scoring customers already stored in TelecomUsers.
+
+    Attributes:
+        training_job_name (str): The name of the training job to use for inference.
+        customer_ids (List[str]): The identifiers of the customers to score.
+    """
+
+    training_job_name: str
+    customer_ids: List[str]
+
+
+class CustomerPrediction(BaseModel):
+    """
+    Prediction for a single stored customer.
+
+    Attributes:
+        customerID (str): The unique identifier of the customer.
+        Churn (str): The predicted Churn label (Yes or No).
+    """
+
+    customerID: str
+    Churn: str
+
+
+class CustomerInferenceResponse(BaseModel):
+    """
+    Response model for scoring stored customers.
+
+    Attributes:
+        prediction (List[CustomerPrediction]): The predictions, in request order.
+        missing (List[str]): The requested identifiers not found in TelecomUsers.
+    """
+
+    prediction: List[CustomerPrediction]
+    missing: List[str]
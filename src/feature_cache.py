@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+from redis.exceptions import RedisError
+
+# Shared by the API and the writers, this module ships with the DAGs
+FEATURE_CACHE_PREFIX = "features:"
+
+
+class FeatureCache:
+    """
+    Transformed feature vectors of TelecomUsers customers in Redis.
+
+    Every customer has a hash holding one float32 vector per transformer, keyed by
+    the digest of the transformer bytes, so models sharing a transformer share the
+    cached vectors. The ETL and the stream consumer delete the hashes of the
+    customers they change whether or not they read the cache themselves, since only
+    the API opts in with FEATURE_CACHE. The TTL bounds the staleness of any
+    invalidation that raced with a refill or failed.
+
+    Attributes:
+        client (redis.Redis): The Redis client.
+        prefix (str): The prefix of the customer keys.
+        ttl (int): The time to live of a customer's vectors in seconds.
+    """
+
+    def __init__(self, client, prefix=FEATURE_CACHE_PREFIX, ttl=24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, customer_id):
+        return f"{self.prefix}{customer_id}"
+
+    def get(self, transformer_digest, customer_ids):
+        """
+        Fetch the cached vectors of customers with one pipeline.
+
+        Args:
+            transformer_digest (str): The digest of the transformer bytes.
+            customer_ids (list): The customer identifiers.
+
+        Returns:
+            dict: The float32 feature vectors keyed by customerID, without the misses.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for customer_id in customer_ids:
+            pipe.hget(self._key(customer_id), transformer_digest)
+        return {
+            customer_id: np.frombuffer(vector, dtype=np.float32)
+            for customer_id, vector in zip(customer_ids, pipe.execute())
+            if vector is not None
+        }
+
+    def put(self, transformer_digest, customer_ids, X):
+        """
+        Cache the vectors of customers.
+
+        Args:
+            transformer_digest (str): The digest of the transformer bytes.
+            customer_ids (list): The customer identifiers, in the row order of X.
+            X (np.ndarray): The transformed features.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        pipe = self.client.pipeline(transaction=False)
+        for customer_id, vector in zip(customer_ids, X):
+            key = self._key(customer_id)
+            pipe.hset(key, transformer_digest, vector.tobytes())
+            pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def invalidate(self, customer_ids):
+        """
+        Drop the cached vectors of customers whose rows changed.
+
+        Must run after the change is committed, so the API cannot cache the old row
+        again. Redis errors are logged rather than raised, the writes they follow
+        are already committed.
+
+        Args:
+            customer_ids (list): The customer identifiers.
+        """
+        if not customer_ids:
+            return
+        try:
+            self.client.delete(
+                *[self._key(customer_id) for customer_id in customer_ids]
+            )
+        except RedisError as e:
+            logging.warning(f"Could not invalidate {len(customer_ids)} features: {e}")
@@ -0,0 +1,69 @@
+import gc
+import os
+import shutil
+
+# Production serving mode: gunicorn manages uvicorn worker processes. For local
+# development run "uvicorn main:app --reload" instead.
+
+# Workers write their metrics to this directory and /metrics aggregates them. It must
+# be set before the app imports prometheus_client, and emptied of previous runs.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Import the app once in the master so workers are forked with it, and its
+# preloaded models, already in memory
+preload_app = True
+# Recycle workers after a jittered number of requests to bound memory growth, they
+# finish their in-flight requests within graceful_timeout
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = 5
+
+
+def when_ready(server):
+    """
+    Load the PRELOAD_MODELS into the master before the first workers are forked.
+
+    The loaded objects are moved to the permanent GC generation, so collections in
+    the workers do not write to their pages and break copy-on-write sharing.
+
+    Args:
+        server (Arbiter): The gunicorn master.
+    """
+    from constants import PRELOAD_MODELS
+    from routers.model import preload_models
+
+    preload_models(PRELOAD_MODELS)
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Give a new worker its own database connections.
+
+    Args:
+        server (Arbiter): The gunicorn master.
+        worker (Worker): The forked worker.
+    """
+    from metrics import reset_pools
+
+    reset_pools()
+
+
+def child_exit(server, worker):
+    """
+    Drop the live gauges of an exited or recycled worker from /metrics.
+
+    Args:
+        server (Arbiter): The gunicorn master.
+        worker (Worker): The exited worker.
+    """
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+from metrics import KINESIS_BATCH_RECORDS, KINESIS_FAILURES, stage
+
+# Kinesis accepts at most 500 records per PutRecords call
+MAX_BATCH_SIZE = 500
+_STOP = object()
+
+
+class KinesisProducer:
+    """
+    Buffered Kinesis producer flushing records with PutRecords from a background task.
+
+    Records are put in a bounded in-process queue and a single background task sends
+    them in batches once the batch is full or the oldest record reaches the maximum
+    age. A full queue makes put() wait, which pushes back on the callers instead of
+    growing memory. Stopping the producer flushes every buffered record.
+
+    Attributes:
+        client (boto3.client): The Kinesis client.
+        stream_name (str): The name of the Kinesis stream.
+        batch_size (int): The number of records that triggers a flush.
+        max_batch_age (float): The maximum time in seconds a record waits in the buffer.
+        max_retries (int): The number of times failed records are retried.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream_name,
+        batch_size=MAX_BATCH_SIZE,
+        max_batch_age=0.05,
+        buffer_size=10000,
+        max_retries=3,
+    ):
+        self.client = client
+        self.stream_name = stream_name
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_batch_age = max_batch_age
+        self.max_retries = max_retries
+        self._buffer_size = buffer_size
+        self._queue = None
+        self._batch_full = None
+        self._task = None
+        self._closing = False
+
+    async def start(self):
+        """
+        Start the background flush task on the running event loop.
+        """
+        self._queue = asyncio.Queue(maxsize=self._buffer_size)
+        self._batch_full = asyncio.Event()
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+        logging.info("Kinesis producer started")
+
+    async def stop(self):
+        """
+        Flush every buffered record and stop the background task.
+
+        Records enqueued by callers that were already waiting on a full queue are
+        flushed after the task stops, so every returned future resolves.
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        await self._queue.put(_STOP)
+        self._batch_full.set()
+        await self._task
+        # Callers that were waiting on a full queue can enqueue behind _STOP, flush
+        # them too so their futures resolve
+        while True:
+            await asyncio.sleep(0)
+            leftover = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    leftover.append(item)
+            if not leftover:
+                break
+            for i in range(0, len(leftover), self.batch_size):
+                await self._flush(leftover[i : i + self.batch_size])
+        self._task = None
+        logging.info("Kinesis producer stopped")
+
+    async def put(self, data, partition_key):
+        """
+        Add a record to the buffer, waiting while the buffer is full.
+
+        Args:
+            data (str | bytes): The record payload.
+            partition_key (str): The partition key of the record.
+
+        Returns:
+            asyncio.Future: Resolves to True once the record is in the stream, or False
+            if it could not be written after all retries.
+
+        Raises:
+            RuntimeError: If the producer is not running.
+        """
+        if self._task is None or self._closing:
+            raise RuntimeError("Kinesis producer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((data, partition_key, future))
+        # The flush task holds one record outside the queue while it waits
+        if self._queue.qsize() >= self.batch_size - 1:
+            self._batch_full.set()
+        return future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+                if self._queue.qsize() < self.batch_size - 1:
+                    self._batch_full.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._batch_full.wait(), self.max_batch_age
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        KINESIS_BATCH_RECORDS.observe(len(batch))
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Jittered exponential backoff before retrying throttled records
+                await asyncio.sleep(random.uniform(0, 0.1 * 2**attempt))
+            try:
+                with stage("kinesis_producer", "put_records"):
+                    response = await asyncio.to_thread(
+                        self.client.put_records,
+                        StreamName=self.stream_name,
+                        Records=[
+                            {"Data": data, "PartitionKey": partition_key}
+                            for data, partition_key, _ in pending
+                        ],
+                    )
+            except Exception as e:
+                logging.error(f"PutRecords call failed: {e}")
+                continue
+
+            failed = []
+            for item, result in zip(pending, response["Records"]):
+                if "ErrorCode" in result:
+                    failed.append(item)
+                elif not item[2].done():
+                    item[2].set_result(True)
+            pending = failed
+            if not pending:
+                return
+
+        logging.error(f"Failed to add {len(pending)} records to stream")
+        KINESIS_FAILURES.inc(len(pending))
+        for _, _, future in pending:
+            if not future.done():
+                future.set_result(False)
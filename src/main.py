@@ -1,9 +1,34 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.responses import RedirectResponse
-from routers.data import data_router
-from routers.model import model_router
+from constants import PROFILING
+from metrics import MetricsMiddleware, render_metrics
+from routers.data import data_router, kinesis_producer
+from routers.model import model_router, warmup
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the background services of the app and flush them on shutdown.
+
+    Preloaded models get a warmup request before the worker accepts traffic.
+
+    Args:
+        app (FastAPI): The application.
+    """
+    await warmup()
+    if kinesis_producer is not None:
+        await kinesis_producer.start()
+    try:
+        yield
+    finally:
+        if kinesis_producer is not None:
+            await kinesis_producer.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -19,5 +44,23 @@ async def read_root():
     return RedirectResponse(url="/docs")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Expose request, stage, cache, Kinesis and connection pool metrics.
+
+    Returns:
+        Response: The metrics in the Prometheus text exposition format.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 app.include_router(data_router)
 app.include_router(model_router)
+
+if PROFILING:
+    # Imported only when enabled, so the profiler is not even loaded otherwise
+    from routers.profiles import install_profiling
+
+    install_profiling(app)
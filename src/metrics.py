@@ -0,0 +1,187 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess
+from sqlalchemy import event
+
+# Buckets tuned for the API: sub-millisecond Redis hits up to multi-second S3 model downloads
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds",
+    "End to end latency of API requests.",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "api_stage_duration_seconds",
+    "Latency of the individual stages of an API request.",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_CACHE = Counter(
+    "model_cache_requests_total",
+    "Model cache lookups by tier and result.",
+    ["tier", "result"],
+)
+MODEL_CACHE_BYTES = Gauge(
+    "model_cache_bytes",
+    "Compressed size of the models cached in Redis.",
+    multiprocess_mode="mostrecent",
+)
+KINESIS_FAILURES = Counter(
+    "kinesis_put_failures_total",
+    "Records that could not be written to the Kinesis stream.",
+)
+KINESIS_BATCH_RECORDS = Histogram(
+    "kinesis_producer_batch_size",
+    "Number of records sent per PutRecords call by the buffered producer.",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500),
+)
+DB_POOL = Gauge(
+    "db_pool_connections",
+    "SQLAlchemy connection pool usage.",
+    ["pool", "state"],
+    multiprocess_mode="livesum",
+)
+
+_pools = {}
+
+
+@lru_cache(maxsize=None)
+def _stage_child(endpoint, name):
+    # Resolving labels takes a lock and a dict lookup, do it once per stage
+    return STAGE_LATENCY.labels(endpoint, name)
+
+
+@contextmanager
+def stage(endpoint, name):
+    """
+    Time a stage of a request and record it in the stage latency histogram.
+
+    Args:
+        endpoint (str): The endpoint the stage belongs to, e.g. "/model/inference".
+        name (str): The name of the stage, e.g. "transform".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_child(endpoint, name).observe(time.perf_counter() - start)
+
+
+def track_pool(name, engine):
+    """
+    Expose the connection pool usage of a SQLAlchemy engine.
+
+    The gauges follow pool events instead of reading the pool at scrape time, so
+    their values reach the shared metric files when several workers serve the app,
+    and are summed across the live workers.
+
+    Args:
+        name (str): The label used for the pool.
+        engine (Engine): The SQLAlchemy engine owning the pool.
+    """
+    checked_out = DB_POOL.labels(name, "checked_out")
+    overflow = DB_POOL.labels(name, "overflow")
+    event.listen(engine, "checkout", lambda *args: checked_out.inc())
+    event.listen(engine, "checkin", lambda *args: checked_out.dec())
+    event.listen(engine, "connect", lambda *args: overflow.inc())
+    event.listen(engine, "close", lambda *args: overflow.dec())
+    event.listen(engine, "close_detached", lambda *args: overflow.dec())
+    _pools[name] = engine
+    _reset_pool_gauges(name, engine)
+
+
+def _reset_pool_gauges(name, engine):
+    size = engine.pool.size()
+    DB_POOL.labels(name, "size").set(size)
+    DB_POOL.labels(name, "checked_out").set(0)
+    # Same meaning as QueuePool.overflow(), open connections minus the pool size
+    DB_POOL.labels(name, "overflow").set(-size)
+
+
+def reset_pools():
+    """
+    Drop the database connections inherited from a parent process.
+
+    Must run in a freshly forked worker before it touches the database, sharing a
+    connection between processes corrupts it. The parent keeps its connections
+    open, and the pool gauges restart from an empty pool.
+    """
+    for name, engine in _pools.items():
+        engine.dispose(close=False)
+        _reset_pool_gauges(name, engine)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the end to end latency of every HTTP request.
+
+    It is a plain ASGI wrapper rather than an @app.middleware("http") function, which
+    would add a task and a response stream copy to every request. The route template
+    is used as the endpoint label so path parameters do not create new series.
+
+    Attributes:
+        app (ASGIApp): The wrapped application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(endpoint, scope["method"], str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def render_metrics():
+    """
+    Render all metrics in the Prometheus text exposition format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set, the metrics of every worker process are
+    aggregated, whichever worker serves the scrape.
+
+    Returns:
+        tuple: The encoded metrics and their content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,170 @@
+import logging
+import sys
+from sqlalchemy import Enum, SmallInteger, create_engine, text
+from constants import DATABASE_URL
+from data_schema import TelecomUsers
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Indexes created by earlier versions of the schema, gender has too few values to
+# be selective and the primary key already covers customerID
+OBSOLETE_INDEXES = ["ix_TelecomUsers_gender", "ix_TelecomUsers_customerID"]
+TABLE_SIZE_QUERY = text(
+    """SELECT pg_size_pretty(pg_total_relation_size('"TelecomUsers"'))"""
+)
+ENUM_LABELS_QUERY = text(
+    "SELECT e.enumlabel FROM pg_enum e JOIN pg_type t ON e.enumtypid = t.oid "
+    "WHERE t.typname = :name"
+)
+COLUMN_TYPES_QUERY = text(
+    "SELECT column_name, udt_name FROM information_schema.columns "
+    "WHERE table_name = 'TelecomUsers'"
+)
+
+
+def compact_columns():
+    """
+    List the TelecomUsers columns stored as enums or smallints.
+
+    Returns:
+        list: The Column objects.
+    """
+    return [
+        column
+        for column in TelecomUsers.__table__.columns
+        if isinstance(column.type, (Enum, SmallInteger))
+    ]
+
+
+def invalid_counts(conn):
+    """
+    Count the values the enum and smallint column types would reject.
+
+    Args:
+        conn (Connection): The database connection.
+
+    Returns:
+        dict: The number of rejected values keyed by column name, without zero counts.
+    """
+    counts = {}
+    for column in compact_columns():
+        if isinstance(column.type, Enum):
+            levels = ", ".join(f"'{level}'" for level in column.type.enums)
+            condition = f'"{column.name}"::text NOT IN ({levels})'
+        else:
+            condition = f'"{column.name}" NOT BETWEEN -32768 AND 32767'
+        count = conn.execute(
+            text(f'SELECT COUNT(*) FROM "TelecomUsers" WHERE {condition}')
+        ).scalar()
+        if count:
+            counts[column.name] = count
+    return counts
+
+
+def sync_enum_types(conn):
+    """
+    Create the missing enum types and append the levels they lack.
+
+    Postgres only lets a new enum value be used once the transaction adding it has
+    committed, so this runs in a transaction of its own before the conversion.
+
+    Args:
+        conn (Connection): The database connection.
+
+    Returns:
+        list: The added levels, as (type name, level) pairs.
+    """
+    added = []
+    synced = set()
+    for column in compact_columns():
+        if not isinstance(column.type, Enum) or column.type.name in synced:
+            continue
+        synced.add(column.type.name)
+        column.type.create(conn, checkfirst=True)
+        labels = set(
+            conn.execute(ENUM_LABELS_QUERY, {"name": column.type.name}).scalars()
+        )
+        for level in column.type.enums:
+            if level not in labels:
+                escaped = level.replace("'", "''")
+                conn.execute(
+                    text(
+                        f"ALTER TYPE {column.type.name} "
+                        f"ADD VALUE IF NOT EXISTS '{escaped}'"
+                    )
+                )
+                added.append((column.type.name, level))
+    return added
+
+
+def migrate(engine):
+    """
+    Convert an existing TelecomUsers table to the compact column types.
+
+    The enum types are created and the levels appended to ENUMS since they were
+    created are added to them first. Then the categorical columns not converted yet
+    are converted to their enum and the integer columns to smallints, and the
+    obsolete indexes are dropped, all in one transaction. The conversion rewrites
+    the table under an exclusive lock, so run it outside of the ETL and streaming
+    windows. A rerun after ENUMS changed only adds the new levels.
+
+    Args:
+        engine (Engine): The SQLAlchemy engine of the database.
+
+    Returns:
+        bool: Whether the table was converted, False if it holds values the new
+            types would reject.
+    """
+    with engine.begin() as conn:
+        for name, level in sync_enum_types(conn):
+            logger.info(f"Added {level!r} to the {name} type")
+
+    with engine.begin() as conn:
+        logger.info(
+            f"TelecomUsers size before: {conn.execute(TABLE_SIZE_QUERY).scalar()}"
+        )
+        counts = invalid_counts(conn)
+        if counts:
+            logger.error(f"Fix or quarantine these values first: {counts}")
+            return False
+
+        current = dict(conn.execute(COLUMN_TYPES_QUERY).all())
+        alters = []
+        for column in compact_columns():
+            if isinstance(column.type, Enum):
+                target, udt_name = column.type.name, column.type.name
+            else:
+                target, udt_name = "SMALLINT", "int2"
+            if current.get(column.name) == udt_name:
+                continue
+            alters.append(
+                f'ALTER COLUMN "{column.name}" TYPE {target} '
+                f'USING "{column.name}"::text::{target}'
+            )
+        if alters:
+            conn.execute(text(f'ALTER TABLE "TelecomUsers" {", ".join(alters)}'))
+        for index in OBSOLETE_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index}"'))
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text('ANALYZE "TelecomUsers"'))
+        logger.info(
+            f"TelecomUsers size after: {conn.execute(TABLE_SIZE_QUERY).scalar()}"
+        )
+    return True
+
+
+if __name__ == "__main__":
+    """
+    Convert the TelecomUsers table of DATABASE_URL to the compact column types.
+
+    New databases get them from Base.metadata.create_all, which does not change
+    types that already exist. Run this once for tables created with the previous
+    string columns, and again whenever levels are appended to ENUMS, before the
+    writers accepting the new levels are deployed. Rerunning it is harmless.
+    """
+    engine = create_engine(DATABASE_URL)
+    if engine.dialect.name != "postgresql":
+        sys.exit("The migration only applies to Postgres")
+    sys.exit(0 if migrate(engine) else 1)
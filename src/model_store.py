@@ -0,0 +1,254 @@
+import io
+import tarfile
+import time
+import zlib
+from constants import MODEL_BUCKET_NAME
+
+ARTIFACTS = ("model.joblib", "transformer.joblib")
+
+
+def fetch_model_tar(s3_client, training_job_name):
+    """
+    Download the model.tar.gz SageMaker wrote for a training job.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        training_job_name (str): The name of the training job.
+
+    Returns:
+        bytes: The gzipped tarball.
+    """
+    model_tar_key = f"{training_job_name}/output/model.tar.gz"
+    response = s3_client.get_object(Bucket=MODEL_BUCKET_NAME, Key=model_tar_key)
+    return response["Body"].read()
+
+
+def extract_artifacts(model_tar_data):
+    """
+    Extract the serialized model and transformer from a model tarball.
+
+    They are returned as raw joblib bytes so callers can cache or ship them to other
+    processes without deserializing them first.
+
+    Args:
+        model_tar_data (bytes): The gzipped tarball.
+
+    Returns:
+        dict: The joblib bytes keyed by artifact name (model.joblib, transformer.joblib).
+
+    Raises:
+        FileNotFoundError: If an artifact is missing from the tarball.
+    """
+    artifacts = {}
+    with tarfile.open(fileobj=io.BytesIO(model_tar_data), mode="r:gz") as tar:
+        for name in ARTIFACTS:
+            try:
+                member = tar.extractfile(name)
+            except KeyError:
+                member = None
+            if member is None:
+                raise FileNotFoundError(f"{name} not found in tarball")
+            artifacts[name] = member.read()
+    return artifacts
+
+
+def download_artifacts(s3_client, training_job_name):
+    """
+    Download the serialized model and transformer of a training job from S3.
+
+    Args:
+        s3_client (boto3.client): The S3 client.
+        training_job_name (str): The name of the training job.
+
+    Returns:
+        dict: The joblib bytes keyed by artifact name (model.joblib, transformer.joblib).
+    """
+    return extract_artifacts(fetch_model_tar(s3_client, training_job_name))
+
+
+class RedisModelStore:
+    """
+    Model artifact cache in Redis with compression, chunking, TTL and LRU eviction.
+
+    Artifacts are compressed and split into fixed-size chunks, so no single Redis
+    command moves a multi-megabyte value and blocks the server for the whole
+    transfer. A manifest hash records the chunk counts of a model. All chunks are
+    fetched with one pipeline. Every key expires after the TTL, and a hit pushes
+    the expiry back. A sorted set indexes the cached models by last access and a
+    hash holds their compressed sizes. When the total size goes over the budget,
+    the least recently used models are evicted.
+
+    Attributes:
+        client (redis.Redis): The Redis client.
+        prefix (str): The prefix of every key.
+        ttl (int): The time to live of a cached model in seconds.
+        max_bytes (int): The budget for the compressed size of all cached models.
+        chunk_size (int): The size of a chunk in bytes.
+        compression_level (int): The zlib level, low levels favour speed.
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix,
+        ttl=7 * 24 * 3600,
+        max_bytes=512 * 1024 * 1024,
+        chunk_size=512 * 1024,
+        compression_level=1,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self._index_key = f"{prefix}index"
+        self._sizes_key = f"{prefix}sizes"
+
+    def _manifest_key(self, training_job_name):
+        return f"{self.prefix}{training_job_name}:manifest"
+
+    def _chunk_key(self, training_job_name, name, i):
+        return f"{self.prefix}{training_job_name}:{name}:{i}"
+
+    def get(self, training_job_name):
+        """
+        Fetch the artifacts of a training job.
+
+        Args:
+            training_job_name (str): The name of the training job.
+
+        Returns:
+            dict: The joblib bytes keyed by artifact name, or None on a miss.
+        """
+        manifest = self.client.hgetall(self._manifest_key(training_job_name))
+        if not manifest:
+            return None
+
+        counts = {name.decode(): int(count) for name, count in manifest.items()}
+        keys = [
+            self._chunk_key(training_job_name, name, i)
+            for name, count in counts.items()
+            for i in range(count)
+        ]
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        chunks = pipe.execute()
+        if any(chunk is None for chunk in chunks):
+            # Partially expired or evicted, treat as a miss
+            return None
+
+        artifacts = {}
+        start = 0
+        for name, count in counts.items():
+            artifacts[name] = zlib.decompress(b"".join(chunks[start : start + count]))
+            start += count
+
+        self._touch(training_job_name, keys)
+        return artifacts
+
+    def put(self, training_job_name, artifacts):
+        """
+        Store the artifacts of a training job, evicting other models if needed.
+
+        Args:
+            training_job_name (str): The name of the training job.
+            artifacts (dict): The joblib bytes keyed by artifact name.
+
+        Returns:
+            int: The compressed size of all cached models after eviction.
+        """
+        manifest_key = self._manifest_key(training_job_name)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(manifest_key)
+        size = 0
+        for name, data in artifacts.items():
+            compressed = zlib.compress(data, self.compression_level)
+            size += len(compressed)
+            chunks = [
+                compressed[i : i + self.chunk_size]
+                for i in range(0, len(compressed), self.chunk_size)
+            ]
+            for i, chunk in enumerate(chunks):
+                pipe.set(
+                    self._chunk_key(training_job_name, name, i), chunk, ex=self.ttl
+                )
+            pipe.hset(manifest_key, name, len(chunks))
+        pipe.expire(manifest_key, self.ttl)
+        pipe.zadd(self._index_key, {training_job_name: time.time()})
+        pipe.hset(self._sizes_key, training_job_name, size)
+        pipe.execute()
+
+        return self.evict()
+
+    def _touch(self, training_job_name, chunk_keys):
+        pipe = self.client.pipeline(transaction=False)
+        for key in chunk_keys + [self._manifest_key(training_job_name)]:
+            pipe.expire(key, self.ttl)
+        pipe.zadd(self._index_key, {training_job_name: time.time()})
+        pipe.execute()
+
+    def delete(self, training_job_name):
+        """
+        Remove a training job from the cache.
+
+        Args:
+            training_job_name (str): The name of the training job.
+        """
+        manifest_key = self._manifest_key(training_job_name)
+        manifest = self.client.hgetall(manifest_key)
+        keys = [
+            self._chunk_key(training_job_name, name.decode(), i)
+            for name, count in manifest.items()
+            for i in range(int(count))
+        ]
+        pipe = self.client.pipeline(transaction=True)
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(manifest_key)
+        pipe.zrem(self._index_key, training_job_name)
+        pipe.hdel(self._sizes_key, training_job_name)
+        pipe.execute()
+
+    def models(self):
+        """
+        List the cached models from least to most recently used.
+
+        Models whose keys expired are dropped from the index on the way.
+
+        Returns:
+            list: Dicts with the training_job_name, compressed size and last access time.
+        """
+        index = self.client.zrange(self._index_key, 0, -1, withscores=True)
+        sizes = self.client.hgetall(self._sizes_key)
+        models = []
+        for name, last_access in index:
+            training_job_name = name.decode()
+            if time.time() - last_access > self.ttl:
+                self.delete(training_job_name)
+                continue
+            models.append(
+                {
+                    "training_job_name": training_job_name,
+                    "size": int(sizes.get(name, 0)),
+                    "last_access": last_access,
+                }
+            )
+        return models
+
+    def evict(self):
+        """
+        Evict least recently used models until the cache fits its budget.
+
+        Returns:
+            int: The compressed size of the models left in the cache.
+        """
+        models = self.models()
+        total = sum(model["size"] for model in models)
+        for model in models[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.delete(model["training_job_name"])
+            total -= model["size"]
+        return total
@@ -0,0 +1,179 @@
+import asyncio
+import hmac
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from pyinstrument import Profiler
+
+logger = logging.getLogger(__name__)
+
+# Client supplied request IDs end up in Redis keys, anything else gets a generated ID
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class ProfileStore:
+    """
+    Request profiles in Redis, keyed by request ID.
+
+    Every profile is an HTML flame graph with a JSON summary next to it. A sorted
+    set indexes the profiles by time and keeps only the most recent ones, and every
+    key expires after the TTL.
+
+    Attributes:
+        client (redis.Redis): The Redis client.
+        prefix (str): The prefix of every key.
+        ttl (int): The time to live of a profile in seconds.
+        max_profiles (int): The number of profiles kept.
+    """
+
+    def __init__(self, client, prefix, ttl=24 * 3600, max_profiles=1000):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_profiles = max_profiles
+        self._index_key = f"{prefix}index"
+
+    def put(self, request_id, summary, html):
+        """
+        Store the profile of a request.
+
+        Args:
+            request_id (str): The request ID.
+            summary (dict): The method, path, status, duration and time of the request.
+            html (str): The rendered profile.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(f"{self.prefix}{request_id}:summary", json.dumps(summary), ex=self.ttl)
+        pipe.set(f"{self.prefix}{request_id}:html", html, ex=self.ttl)
+        pipe.zadd(self._index_key, {request_id: summary["timestamp"]})
+        pipe.zremrangebyscore(self._index_key, "-inf", time.time() - self.ttl)
+        pipe.zremrangebyrank(self._index_key, 0, -self.max_profiles - 1)
+        pipe.execute()
+
+    def list(self):
+        """
+        List the stored profiles, most recent first.
+
+        Returns:
+            list: The profile summaries with their request IDs.
+        """
+        request_ids = self.client.zrevrange(self._index_key, 0, -1)
+        if not request_ids:
+            return []
+        summaries = self.client.mget(
+            [
+                f"{self.prefix}{request_id.decode()}:summary"
+                for request_id in request_ids
+            ]
+        )
+        return [
+            {"request_id": request_id.decode(), **json.loads(summary)}
+            for request_id, summary in zip(request_ids, summaries)
+            if summary is not None
+        ]
+
+    def get(self, request_id):
+        """
+        Fetch the rendered profile of a request.
+
+        Args:
+            request_id (str): The request ID.
+
+        Returns:
+            str: The HTML flame graph, or None if it is unknown or expired.
+        """
+        html = self.client.get(f"{self.prefix}{request_id}:html")
+        return html.decode() if html is not None else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware running selected requests under the pyinstrument sampling profiler.
+
+    A request is profiled when its X-Profile header carries the profiling token, or
+    at random with the configured sample rate. Its profile is stored under its
+    X-Request-ID header, or a generated ID, which is returned in the X-Profile-ID
+    response header. The ID of a request sampled without the token gets a random
+    suffix, so it cannot replace another stored profile.
+
+    The middleware is only installed when profiling is enabled, so it costs nothing
+    otherwise.
+
+    Attributes:
+        app (ASGIApp): The wrapped application.
+        store (ProfileStore): Where profiles are stored.
+        token (str): The token unlocking profiling by header, header profiling is off when empty.
+        sample_rate (float): The fraction of requests profiled at random.
+        interval (float): The sampling interval of the profiler in seconds.
+    """
+
+    def __init__(self, app, store, token="", sample_rate=0.0, interval=0.001):
+        self.app = app
+        self.store = store
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.interval = interval
+
+    def _authenticated(self, headers):
+        header = headers.get(b"x-profile")
+        return (
+            bool(self.token)
+            and header is not None
+            and hmac.compare_digest(header, self.token)
+        )
+
+    def _sampled(self):
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        authenticated = self._authenticated(headers)
+        if not authenticated and not self._sampled():
+            await self.app(scope, receive, send)
+            return
+
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        elif not authenticated:
+            # Without the token a client could reuse the ID of a stored profile and
+            # overwrite it, a random suffix keeps sampled profiles apart
+            request_id = f"{request_id}-{uuid.uuid4().hex[:12]}"
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", request_id.encode())
+                ]
+            await send(message)
+
+        # Only samples the task of this request, not concurrent requests
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        start = time.time()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            summary = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration": time.time() - start,
+                "timestamp": start,
+            }
+            try:
+                await asyncio.to_thread(
+                    lambda: self.store.put(request_id, summary, profiler.output_html())
+                )
+            except Exception as e:
+                logger.warning(f"Could not store profile {request_id}: {e}")
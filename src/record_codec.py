@@ -0,0 +1,210 @@
+import io
+import json
+import re
+import msgpack
+
+# Header byte of version 1 compact records, followed by a msgpack array of the
+# FIELDS values. JSON records start with "{", so both formats can share a stream.
+COMPACT_V1 = 0x01
+
+FIELDS = [
+    "customerID",
+    "gender",
+    "SeniorCitizen",
+    "Partner",
+    "Dependents",
+    "tenure",
+    "PhoneService",
+    "MultipleLines",
+    "InternetService",
+    "OnlineSecurity",
+    "OnlineBackup",
+    "DeviceProtection",
+    "TechSupport",
+    "StreamingTV",
+    "StreamingMovies",
+    "Contract",
+    "PaperlessBilling",
+    "PaymentMethod",
+    "MonthlyCharges",
+    "TotalCharges",
+    "Churn",
+]
+
+YES_NO = ["Yes", "No"]
+INTERNET_ADDON = ["Yes", "No", "No internet service"]
+# Categorical fields are sent as their position in these lists. Records already in
+# the stream depend on the positions, so new levels must only be appended. They are
+# also the levels of the TelecomUsers enum types, rerun migrate_telecom_users.py to
+# add appended levels to an existing database before deploying the writers.
+ENUMS = {
+    "gender": ["Male", "Female"],
+    "Partner": YES_NO,
+    "Dependents": YES_NO,
+    "PhoneService": YES_NO,
+    "MultipleLines": ["Yes", "No", "No phone service"],
+    "InternetService": ["DSL", "Fiber optic", "No"],
+    "OnlineSecurity": INTERNET_ADDON,
+    "OnlineBackup": INTERNET_ADDON,
+    "DeviceProtection": INTERNET_ADDON,
+    "TechSupport": INTERNET_ADDON,
+    "StreamingTV": INTERNET_ADDON,
+    "StreamingMovies": INTERNET_ADDON,
+    "Contract": ["Month-to-month", "One year", "Two year"],
+    "PaperlessBilling": YES_NO,
+    "PaymentMethod": [
+        "Electronic check",
+        "Mailed check",
+        "Bank transfer (automatic)",
+        "Credit card (automatic)",
+    ],
+    "Churn": YES_NO,
+}
+
+_CODES = [
+    {level: code for code, level in enumerate(ENUMS[field])} if field in ENUMS else None
+    for field in FIELDS
+]
+_LEVELS = [ENUMS.get(field) for field in FIELDS]
+_HEADER = bytes([COMPACT_V1])
+# Where decoding resumes after a malformed JSON record
+_RECORD_START = re.compile(rb"[{\x01]")
+_JSON_DECODER = json.JSONDecoder()
+
+
+class RecordDecodeError(ValueError):
+    """
+    Raised when a stream record is neither valid JSON nor a valid compact record.
+    """
+
+
+def encode_record(record):
+    """
+    Encode a record in the compact format.
+
+    Categorical values outside ENUMS are kept as strings, so validation downstream
+    still sees and rejects them.
+
+    Args:
+        record (dict): The record, keyed by the names in FIELDS.
+
+    Returns:
+        bytes: The header byte followed by the msgpack payload.
+    """
+    values = []
+    for field, codes in zip(FIELDS, _CODES):
+        value = record.get(field)
+        if codes is not None:
+            value = codes.get(value, value)
+        values.append(value)
+    return _HEADER + msgpack.packb(values)
+
+
+def _decode_values(values):
+    if not isinstance(values, list) or len(values) != len(FIELDS):
+        raise RecordDecodeError("Compact record does not match the version 1 fields")
+    record = {}
+    for field, levels, value in zip(FIELDS, _LEVELS, values):
+        if levels is not None and type(value) is int:
+            if not 0 <= value < len(levels):
+                raise RecordDecodeError(f"Unknown code {value} for {field}")
+            value = levels[value]
+        record[field] = value
+    return record
+
+
+def decode_record(data):
+    """
+    Decode a single record in the compact or the JSON format.
+
+    Args:
+        data (bytes): The record, a str is accepted for JSON.
+
+    Returns:
+        dict: The record, keyed by field name.
+
+    Raises:
+        RecordDecodeError: If the record cannot be decoded.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if data[:1] == _HEADER:
+        try:
+            return _decode_values(msgpack.unpackb(data[1:]))
+        except (ValueError, msgpack.UnpackException) as e:
+            raise RecordDecodeError(f"Invalid compact record: {e}") from e
+    try:
+        record = json.loads(data)
+    except ValueError as e:
+        raise RecordDecodeError(f"Invalid JSON record: {e}") from e
+    if not isinstance(record, dict):
+        raise RecordDecodeError("JSON record is not an object")
+    return record
+
+
+def iter_records(data):
+    """
+    Split concatenated records, as Firehose writes them to S3, and decode them.
+
+    Compact and JSON records may be mixed. A JSON record ends where the JSON value
+    ends, so braces inside its strings are harmless. A malformed JSON record is
+    skipped up to the next "{" or header byte. Compact records carry no length, so a
+    malformed one ends the decoding of the object.
+
+    Args:
+        data (bytes): The object body.
+
+    Yields:
+        tuple: The decoded record, or None if it is malformed, and its raw bytes.
+    """
+    pos = 0
+    size = len(data)
+    # Latin-1 maps every byte to one character, so string and byte offsets match.
+    # Only ASCII records can be taken from it as is, others are decoded as UTF-8
+    text = None
+    while pos < size:
+        if data[pos : pos + 1].isspace():
+            pos += 1
+            continue
+
+        if data[pos] != COMPACT_V1:
+            if text is None:
+                text = data.decode("latin-1")
+            try:
+                record, end = _JSON_DECODER.raw_decode(text, pos)
+            except ValueError:
+                match = _RECORD_START.search(data, pos + 1)
+                end = match.start() if match else size
+                yield None, data[pos:end]
+                pos = end
+                continue
+            raw = data[pos:end]
+            if not raw.isascii():
+                try:
+                    record = decode_record(raw)
+                except RecordDecodeError:
+                    record = None
+            yield record if isinstance(record, dict) else None, raw
+            pos = end
+            continue
+
+        # One unpacker reads the whole run of compact records, the header byte is
+        # itself a msgpack integer
+        stream = io.BytesIO(data)
+        stream.seek(pos)
+        unpacker = msgpack.Unpacker(stream)
+        start = pos
+        while pos < size and data[pos] == COMPACT_V1:
+            try:
+                unpacker.unpack()
+                values = unpacker.unpack()
+            except (ValueError, msgpack.UnpackException):
+                yield None, data[pos:]
+                return
+            end = start + unpacker.tell()
+            try:
+                record = _decode_values(values)
+            except RecordDecodeError:
+                record = None
+            yield record, data[pos:end]
+            pos = end
@@ -1,70 +1,146 @@
 from datetime import timedelta
 import json
 import logging
+from typing import Optional
 from fastapi import APIRouter, HTTPException
 from fastapi.encoders import jsonable_encoder
 import redis
 import boto3
-from constants import DATABASE_URL, REDIS_HOST, REDIS_PORT, STREAM_NAME
+from constants import (
+    DATABASE_URL,
+    KINESIS_BATCH_SIZE,
+    KINESIS_BUFFER_SIZE,
+    KINESIS_BUFFERED_PRODUCER,
+    KINESIS_MAX_BATCH_AGE,
+    REDIS_HOST,
+    REDIS_PORT,
+    STREAM_NAME,
+    STREAM_RECORD_ENCODING,
+)
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from data_schema import ChurnData, ResponseModel, TelecomUsers, Base
+from churn_stats import STATS_DIMENSIONS
+from data_schema import ChurnData, ChurnStats, ResponseModel, TelecomUsers, Base
+from kinesis_producer import KinesisProducer
+from metrics import KINESIS_FAILURES, stage, track_pool
+from record_codec import encode_record
 
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
 kinesis_client = boto3.client("kinesis", region_name="us-east-1")
+kinesis_producer = (
+    KinesisProducer(
+        kinesis_client,
+        STREAM_NAME,
+        batch_size=KINESIS_BATCH_SIZE,
+        max_batch_age=KINESIS_MAX_BATCH_AGE,
+        buffer_size=KINESIS_BUFFER_SIZE,
+    )
+    if KINESIS_BUFFERED_PRODUCER
+    else None
+)
 data_router = APIRouter(prefix="/data")
 
 engine = create_engine(DATABASE_URL)
 Session = sessionmaker(bind=engine)
 Base.metadata.create_all(engine, checkfirst=True)
+track_pool("data", engine)
 CACHE_EXPIRATION_TIME = timedelta(days=1)
+STATS_CACHE_EXPIRATION_TIME = timedelta(minutes=1)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def cache_ingested(redis_key_id, payload):
+    """
+    Remember an ingested record in Redis so duplicates are not sent to the stream again.
+
+    Args:
+        redis_key_id (str): The Redis key identifying the record.
+        payload (str): The serialized record.
+    """
+    with stage("/data/ingest", "redis_set"):
+        redis_client.delete(redis_key_id)
+        redis_client.set(
+            redis_key_id,
+            payload,
+            ex=int(CACHE_EXPIRATION_TIME.total_seconds()),
+        )
+
+
 @data_router.post("/ingest")
-async def send_data(user: ChurnData) -> ResponseModel:
+async def send_data(user: ChurnData, wait: bool = True) -> ResponseModel:
     """
     Ingest user data and send it to an AWS Kinesis stream.
 
     This endpoint ingests user data, sends it to an AWS Kinesis stream, and caches the data in Redis.
+    Records are written as JSON unless STREAM_RECORD_ENCODING is set to "compact",
+    the binary format of record_codec.
     If the data is already cached, it returns a response indicating that the data is already in the stream.
     If the data is successfully sent to the stream, it updates the cache.
 
+    When the buffered producer is enabled the record is handed to it instead of being sent
+    with its own PutRecord call. With wait set to False the endpoint acknowledges the record
+    as soon as it is buffered, otherwise it waits for the batch containing it to be flushed.
+
     Args:
         user (ChurnData): The user churn data to be ingested.
+        wait (bool): Whether to wait for the buffered producer to flush the record.
 
     Returns:
         ResponseModel: A response model containing the status, cache status, and response data.
     """
     redis_key_id = f"user:{user.customerID}:{user.gender}:{user.SeniorCitizen}:{user.Partner}:{user.Dependents}:{user.tenure}:{user.PhoneService}:{user.MultipleLines}:{user.InternetService}:{user.OnlineSecurity}"
-    cached_data = redis_client.get(redis_key_id)
+    with stage("/data/ingest", "redis_get"):
+        cached_data = redis_client.get(redis_key_id)
 
     if cached_data:
         return ResponseModel(
             status="Success", cached=True, response={"result": "Data already in stream"}
         )
 
-    response = kinesis_client.put_record(
-        StreamName=STREAM_NAME,
-        Data=json.dumps(user.dict()),
-        PartitionKey=str(user.customerID),
-    )
-
-    if response["ResponseMetadata"]["HTTPStatusCode"] != 200:
+    if STREAM_RECORD_ENCODING == "compact":
+        payload = encode_record(user.model_dump())
+    else:
+        payload = json.dumps(user.dict())
+
+    if kinesis_producer is not None:
+        with stage("/data/ingest", "kinesis_buffer"):
+            future = await kinesis_producer.put(payload, str(user.customerID))
+        if not wait:
+            future.add_done_callback(
+                lambda f: f.result() and cache_ingested(redis_key_id, payload)
+            )
+            return ResponseModel(
+                status="Success",
+                cached=False,
+                response={"result": "Data accepted for stream"},
+            )
+        with stage("/data/ingest", "kinesis_put"):
+            added = await future
+    else:
+        try:
+            with stage("/data/ingest", "kinesis_put"):
+                response = kinesis_client.put_record(
+                    StreamName=STREAM_NAME,
+                    Data=payload,
+                    PartitionKey=str(user.customerID),
+                )
+        except Exception:
+            KINESIS_FAILURES.inc()
+            raise
+        added = response["ResponseMetadata"]["HTTPStatusCode"] == 200
+        if not added:
+            KINESIS_FAILURES.inc()
+
+    if not added:
         return ResponseModel(
             status="Failed",
             cached=False,
             response={"result": "Failed to add data to stream"},
         )
 
-    redis_client.delete(redis_key_id)
-    redis_client.set(
-        redis_key_id,
-        json.dumps(user.dict()),
-        ex=int(CACHE_EXPIRATION_TIME.total_seconds()),
-    )
+    cache_ingested(redis_key_id, payload)
 
     return ResponseModel(
         status="Success", cached=False, response={"result": "Data added to stream"}
@@ -89,11 +165,13 @@ async def list_users(limit: int) -> ResponseModel:
     """
     session = Session()
     try:
-        users = session.query(TelecomUsers).limit(limit).all()
+        with stage("/data/list_users", "db_query"):
+            users = session.query(TelecomUsers).limit(limit).all()
         if users:
-            return ResponseModel(
-                status="Success", cached=False, response=jsonable_encoder(users)
-            )
+            with stage("/data/list_users", "response_build"):
+                return ResponseModel(
+                    status="Success", cached=False, response=jsonable_encoder(users)
+                )
         return ResponseModel(
             status="Failed",
             cached=False,
@@ -103,3 +181,65 @@ async def list_users(limit: int) -> ResponseModel:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         session.close()
+
+
+@data_router.get("/stats")
+async def stats(dimension: Optional[str] = None) -> ResponseModel:
+    """
+    Retrieve churn rates grouped by Contract, InternetService, PaymentMethod and tenure bucket.
+
+    This endpoint reads the precomputed ChurnStats table, which the ETL keeps up to date
+    incrementally, so its cost does not depend on the size of TelecomUsers. Results are
+    cached in Redis for a minute.
+
+    Args:
+        dimension (Optional[str]): Restrict the response to a single dimension.
+
+    Returns:
+        ResponseModel: A response model containing the status, cache status, and, for every
+        dimension, the customers, churned customers and churn rate of each value.
+    """
+    if dimension is not None and dimension not in STATS_DIMENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown dimension {dimension}, expected one of {', '.join(STATS_DIMENSIONS)}",
+        )
+
+    cache_key = f"stats:{dimension or 'all'}"
+    with stage("/data/stats", "redis_get"):
+        cached_stats = redis_client.get(cache_key)
+    if cached_stats:
+        return ResponseModel(
+            status="Success", cached=True, response=json.loads(cached_stats)
+        )
+
+    session = Session()
+    try:
+        query = session.query(ChurnStats).filter(ChurnStats.customers > 0)
+        if dimension is not None:
+            query = query.filter(ChurnStats.dimension == dimension)
+        with stage("/data/stats", "db_query"):
+            rows = query.order_by(ChurnStats.dimension, ChurnStats.value).all()
+
+        response = {}
+        for row in rows:
+            response.setdefault(row.dimension, []).append(
+                {
+                    "value": row.value,
+                    "customers": row.customers,
+                    "churned": row.churned,
+                    "churn_rate": round(row.churned / row.customers, 4),
+                }
+            )
+
+        with stage("/data/stats", "redis_set"):
+            redis_client.set(
+                cache_key,
+                json.dumps(response),
+                ex=int(STATS_CACHE_EXPIRATION_TIME.total_seconds()),
+            )
+        return ResponseModel(status="Success", cached=False, response=response)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        session.close()
@@ -1,18 +1,23 @@
 from datetime import datetime
+import hashlib
 import io
 import json
 import logging
-import tarfile
 from fastapi import APIRouter, HTTPException
 import joblib
+import numpy as np
 import pandas as pd
 import redis
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select
 import boto3
 from constants import (
     DATABASE_URL,
+    FEATURE_CACHE,
+    FEATURE_CACHE_TTL,
     MODEL_BUCKET_NAME,
+    MODEL_CACHE_MAX_BYTES,
+    MODEL_CACHE_TTL,
     REDIS_CACHE_PREFIX,
     REDIS_HOST,
     REDIS_PORT,
@@ -20,21 +25,95 @@ from constants import (
 )
 from data_schema import (
     ChurnData,
+    CustomerInferenceRequest,
+    CustomerInferenceResponse,
+    CustomerPrediction,
     InferenceRequest,
     InferenceResponse,
     StatusRequest,
     StatusResponse,
+    TelecomUsers,
     TrainRequest,
     TrainResponse,
+    UserData,
 )
+from feature_cache import FEATURE_CACHE_PREFIX, FeatureCache
+from metrics import MODEL_CACHE, MODEL_CACHE_BYTES, stage, track_pool
+from model_store import RedisModelStore, extract_artifacts, fetch_model_tar
 
 sagemaker_client = boto3.client("sagemaker", region_name="us-east-1")
 sqs_client = boto3.client("sqs", region_name="us-east-1")
 s3_client = boto3.client("s3", region_name="us-east-1")
 redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+model_store = RedisModelStore(
+    redis_client,
+    REDIS_CACHE_PREFIX,
+    ttl=MODEL_CACHE_TTL,
+    max_bytes=MODEL_CACHE_MAX_BYTES,
+)
+feature_cache = (
+    FeatureCache(redis_client, FEATURE_CACHE_PREFIX, ttl=FEATURE_CACHE_TTL)
+    if FEATURE_CACHE
+    else None
+)
+# Keeps the IN list of a customer lookup well under the bind parameter limits
+CUSTOMER_FETCH_SIZE = 5000
+
+# Models preloaded into process memory, keyed by training job name
+loaded_models = {}
+
+# First row of input.csv, sent through every preloaded model by warmup()
+WARMUP_USER = UserData(
+    customerID="7590-VHVEG",
+    gender="Female",
+    SeniorCitizen=0,
+    Partner="Yes",
+    Dependents="No",
+    tenure=1,
+    PhoneService="No",
+    MultipleLines="No phone service",
+    InternetService="DSL",
+    OnlineSecurity="No",
+    OnlineBackup="Yes",
+    DeviceProtection="No",
+    TechSupport="No",
+    StreamingTV="No",
+    StreamingMovies="No",
+    Contract="Month-to-month",
+    PaperlessBilling="Yes",
+    PaymentMethod="Electronic check",
+    MonthlyCharges=29.85,
+    TotalCharges=29.85,
+)
 
 model_router = APIRouter(prefix="/model")
 engine = create_engine(DATABASE_URL)
+track_pool("model", engine)
+
+
+def export_users_csv():
+    """
+    Export the TelecomUsers table as CSV with a header row.
+
+    Postgres writes the CSV itself with COPY, which skips building a DataFrame of
+    the whole table.
+
+    Returns:
+        str: The CSV data.
+    """
+    if engine.dialect.name != "postgresql":
+        return pd.read_sql('SELECT * FROM "TelecomUsers"', engine).to_csv(index=False)
+
+    buffer = io.StringIO()
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY "TelecomUsers" TO STDOUT WITH (FORMAT csv, HEADER)', buffer
+            )
+    finally:
+        conn.close()
+    return buffer.getvalue()
 
 
 @model_router.post("/train")
@@ -58,14 +137,13 @@ async def train(request: TrainRequest) -> TrainResponse:
         )
         if request.s3_path is None:
             logging.info("No S3 path provided. Fetching data from the database.")
-            query = 'SELECT * FROM "TelecomUsers"'
-            df = pd.read_sql(query, engine)
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, index=False)
+            with stage("/model/train", "db_export"):
+                csv_data = export_users_csv()
             s3_key = f"{training_job_name}/data/input.csv"
-            s3_client.put_object(
-                Bucket=MODEL_BUCKET_NAME, Key=s3_key, Body=csv_buffer.getvalue()
-            )
+            with stage("/model/train", "s3_upload"):
+                s3_client.put_object(
+                    Bucket=MODEL_BUCKET_NAME, Key=s3_key, Body=csv_data
+                )
             s3_path = f"s3://{MODEL_BUCKET_NAME}/{s3_key}"
             request.s3_path = s3_path
 
@@ -73,7 +151,8 @@ async def train(request: TrainRequest) -> TrainResponse:
         request_dict["training_job_name"] = training_job_name
 
         message_body = json.dumps(request_dict)
-        sqs_client.send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=message_body)
+        with stage("/model/train", "sqs_send"):
+            sqs_client.send_message(QueueUrl=SQS_QUEUE_URL, MessageBody=message_body)
 
         return TrainResponse(
             message=f"Training job {training_job_name} request submitted successfully."
@@ -104,79 +183,217 @@ async def status(request: StatusRequest) -> StatusResponse:
         return StatusResponse(training_job_status=f"Training not started yet {str(e)}")
 
 
+def load_model(training_job_name):
+    """
+    Load the model and transformer of a training job from Redis, or from S3 on a miss.
+
+    Args:
+        training_job_name (str): The name of the training job.
+
+    Returns:
+        tuple: The deserialized model and transformer, and a digest of the transformer bytes.
+    """
+    # Check if the model and transformer are in the cache
+    with stage("/model/inference", "redis_get"):
+        artifacts = model_store.get(training_job_name)
+
+    if artifacts is None:
+        MODEL_CACHE.labels("redis", "miss").inc()
+        # Download the model.tar.gz file from S3 into memory
+        with stage("/model/inference", "s3_download"):
+            model_tar_data = fetch_model_tar(s3_client, training_job_name)
+        with stage("/model/inference", "tar_extract"):
+            artifacts = extract_artifacts(model_tar_data)
+        with stage("/model/inference", "redis_set"):
+            MODEL_CACHE_BYTES.set(model_store.put(training_job_name, artifacts))
+            # Drop the uncompressed single-value entries of older releases
+            redis_client.delete(
+                f"{REDIS_CACHE_PREFIX}{training_job_name}:model",
+                f"{REDIS_CACHE_PREFIX}{training_job_name}:transformer",
+            )
+        logging.info("Model and transformer downloaded and cached successfully")
+    else:
+        MODEL_CACHE.labels("redis", "hit").inc()
+        logging.info("Model and transformer loaded from cache")
+
+    # Deserialize the model and transformer
+    with stage("/model/inference", "joblib_load"):
+        model = joblib.load(io.BytesIO(artifacts["model.joblib"]))
+        transformer = joblib.load(io.BytesIO(artifacts["transformer.joblib"]))
+    transformer_digest = hashlib.sha256(artifacts["transformer.joblib"]).hexdigest()
+    return model, transformer, transformer_digest
+
+
+def get_model(training_job_name):
+    """
+    Get the model of a training job from process memory, or load it.
+
+    Args:
+        training_job_name (str): The name of the training job.
+
+    Returns:
+        tuple: The model and transformer, and a digest of the transformer bytes.
+    """
+    loaded = loaded_models.get(training_job_name)
+    if loaded is not None:
+        MODEL_CACHE.labels("process", "hit").inc()
+        return loaded
+    return load_model(training_job_name)
+
+
+def preload_models(training_job_names):
+    """
+    Load models into process memory so inference skips Redis and deserialization.
+
+    Meant to run in the gunicorn master before the workers are forked, so every
+    worker shares the model pages copy-on-write instead of holding its own copy.
+    The S3 connections opened on the way are closed so no socket is shared with the
+    workers.
+
+    Args:
+        training_job_names (list): The names of the training jobs to load.
+    """
+    for training_job_name in training_job_names:
+        loaded_models[training_job_name] = load_model(training_job_name)
+        logging.info(f"Preloaded model {training_job_name}")
+    s3_client.close()
+
+
+async def warmup():
+    """
+    Send one inference request through every preloaded model.
+
+    The first prediction of a model pays for lazy imports and allocations, this
+    moves that cost out of the first real request of a worker.
+    """
+    for training_job_name in loaded_models:
+        try:
+            await inference(
+                InferenceRequest(
+                    training_job_name=training_job_name, input_data=[WARMUP_USER]
+                )
+            )
+        except HTTPException as e:
+            logging.warning(f"Warmup of {training_job_name} failed: {e.detail}")
+
+
 @model_router.post("/inference")
 async def inference(request: InferenceRequest) -> InferenceResponse:
     """
     Perform inference using the trained model.
 
-    This endpoint performs inference using the trained model. It checks if the model
-    and transformer are cached in Redis. If not, it downloads them from S3, caches them,
-    and then uses them to make predictions.
+    This endpoint performs inference using the trained model. Preloaded models are
+    used straight from process memory. Otherwise it checks if the model and
+    transformer are cached in Redis. If not, it downloads them from S3, caches them
+    compressed and chunked in the model store, and then uses them to make predictions.
+
+    Several models can be compared with training_job_names. The input DataFrame is
+    built once, and models whose transformers are byte-identical share one transform.
 
     Args:
-        request (InferenceRequest): The request containing the training job name and input data.
+        request (InferenceRequest): The request containing the training job name(s) and input data.
 
     Returns:
         InferenceResponse: A response containing the predictions.
     """
     try:
-        cache_key_model = f"{REDIS_CACHE_PREFIX}{request.training_job_name}:model"
-        cache_key_transformer = (
-            f"{REDIS_CACHE_PREFIX}{request.training_job_name}:transformer"
-        )
+        training_job_names = request.training_job_names or [request.training_job_name]
+        models = {}
+        for training_job_name in training_job_names:
+            if training_job_name not in models:
+                models[training_job_name] = get_model(training_job_name)
+
+        with stage("/model/inference", "dataframe_build"):
+            df = pd.DataFrame([data.dict() for data in request.input_data])
+
+        features = {}
+        predictions = {}
+        for training_job_name, (model, transformer, digest) in models.items():
+            if digest not in features:
+                with stage("/model/inference", "transform"):
+                    features[digest] = transformer.transform(df)
+            with stage("/model/inference", "predict"):
+                y_pred = model.predict(features[digest])
+            predictions[training_job_name] = y_pred.tolist()
+        prediction = predictions[training_job_names[0]]
 
-        # Check if the model and transformer are in the cache
-        model_bytes = redis_client.get(cache_key_model)
-        transformer_bytes = redis_client.get(cache_key_transformer)
-
-        if model_bytes is None or transformer_bytes is None:
-            # Download the model.tar.gz file from S3 into memory
-            model_tar_key = f"{request.training_job_name}/output/model.tar.gz"
-            response = s3_client.get_object(Bucket=MODEL_BUCKET_NAME, Key=model_tar_key)
-            model_tar_data = response["Body"].read()
-
-            # Extract the contents of the tarball in memory
-            with tarfile.open(fileobj=io.BytesIO(model_tar_data), mode="r:gz") as tar:
-                # Extract model.joblib
-                model_file = tar.extractfile("model.joblib")
-                if model_file:
-                    model = joblib.load(model_file)
-                    model_bytes = io.BytesIO()
-                    joblib.dump(model, model_bytes)
-                    model_bytes.seek(0)
-                    redis_client.set(cache_key_model, model_bytes.getvalue())
-                    logging.info("Model loaded and cached successfully")
-                else:
-                    raise FileNotFoundError("Model file not found in tarball")
-
-                # Extract transformer.joblib
-                transformer_file = tar.extractfile("transformer.joblib")
-                if transformer_file:
-                    transformer = joblib.load(transformer_file)
-                    transformer_bytes = io.BytesIO()
-                    joblib.dump(transformer, transformer_bytes)
-                    transformer_bytes.seek(0)
-                    redis_client.set(
-                        cache_key_transformer, transformer_bytes.getvalue()
-                    )
-                    logging.info("Transformer loaded and cached successfully")
-                else:
-                    raise FileNotFoundError("Transformer file not found in tarball")
-        else:
-            # Deserialize the model and transformer from the cache
-            model = joblib.load(io.BytesIO(model_bytes))
-            transformer = joblib.load(io.BytesIO(transformer_bytes))
-            logging.info("Model and transformer loaded from cache")
-
-        df = pd.DataFrame([data.dict() for data in request.input_data])
-        X = transformer.transform(df)
-        y_pred = model.predict(X)
-        prediction = y_pred.tolist()
-
-        response_list = []
-        for i, data in enumerate(request.input_data):
-            response_list.append(ChurnData(**data.model_dump(), Churn=prediction[i]))
+        with stage("/model/inference", "response_build"):
+            response_list = []
+            for i, data in enumerate(request.input_data):
+                response_list.append(
+                    ChurnData(**data.model_dump(), Churn=prediction[i])
+                )
 
+        if request.training_job_names:
+            return InferenceResponse(prediction=response_list, predictions=predictions)
         return InferenceResponse(prediction=response_list)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@model_router.post("/inference/customers")
+async def inference_customers(
+    request: CustomerInferenceRequest,
+) -> CustomerInferenceResponse:
+    """
+    Score customers stored in TelecomUsers by their identifiers.
+
+    The feature rows are fetched from the database in bulk instead of being sent in
+    the request. When the feature cache is enabled, cached feature vectors skip the
+    database and the transform, and freshly transformed ones are cached.
+
+    Args:
+        request (CustomerInferenceRequest): The request containing the training job name and customer identifiers.
+
+    Returns:
+        CustomerInferenceResponse: A response containing the predictions and the unknown identifiers.
+    """
+    try:
+        model, transformer, digest = get_model(request.training_job_name)
+        customer_ids = list(dict.fromkeys(request.customer_ids))
+
+        features = {}
+        if feature_cache is not None:
+            with stage("/model/inference/customers", "feature_cache_get"):
+                features = feature_cache.get(digest, customer_ids)
+
+        uncached = [c for c in customer_ids if c not in features]
+        for start in range(0, len(uncached), CUSTOMER_FETCH_SIZE):
+            with stage("/model/inference/customers", "db_fetch"):
+                df = pd.read_sql(
+                    select(TelecomUsers).where(
+                        TelecomUsers.customerID.in_(
+                            uncached[start : start + CUSTOMER_FETCH_SIZE]
+                        )
+                    ),
+                    engine,
+                )
+            if df.empty:
+                continue
+            with stage("/model/inference/customers", "transform"):
+                X = transformer.transform(df)
+                if hasattr(X, "toarray"):
+                    X = X.toarray()
+                # Tree models predict on float32 anyway, the cache stores float32 too
+                X = np.asarray(X, dtype=np.float32)
+            features.update(zip(df["customerID"], X))
+            if feature_cache is not None:
+                with stage("/model/inference/customers", "feature_cache_set"):
+                    feature_cache.put(digest, df["customerID"].tolist(), X)
+
+        found = [c for c in customer_ids if c in features]
+        prediction = []
+        if found:
+            with stage("/model/inference/customers", "predict"):
+                y_pred = model.predict(np.vstack([features[c] for c in found]))
+            prediction = [
+                CustomerPrediction(customerID=c, Churn=churn)
+                for c, churn in zip(found, y_pred.tolist())
+            ]
+
+        return CustomerInferenceResponse(
+            prediction=prediction,
+            missing=[c for c in customer_ids if c not in features],
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
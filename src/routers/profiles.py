@@ -0,0 +1,84 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import HTMLResponse
+import redis
+from constants import (
+    PROFILE_PREFIX,
+    PROFILE_TTL,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_TOKEN,
+    REDIS_HOST,
+    REDIS_PORT,
+)
+from profiling import ProfileStore, ProfilingMiddleware
+
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+profile_store = ProfileStore(redis_client, PROFILE_PREFIX, ttl=PROFILE_TTL)
+profiles_router = APIRouter(prefix="/admin/profiles", include_in_schema=False)
+
+
+def install_profiling(app):
+    """
+    Add the profiling middleware and the profile admin endpoints to the app.
+
+    Args:
+        app (FastAPI): The application.
+    """
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        token=PROFILING_TOKEN,
+        sample_rate=PROFILING_SAMPLE_RATE,
+    )
+    app.include_router(profiles_router)
+
+
+def check_token(token):
+    """
+    Reject admin requests without the profiling token.
+
+    Args:
+        token (str): The X-Profile-Token header of the request.
+
+    Raises:
+        HTTPException: If profiling has no token or the header does not match it.
+    """
+    if not PROFILING_TOKEN or not hmac.compare_digest(
+        (token or "").encode(), PROFILING_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+@profiles_router.get("")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """
+    List the stored request profiles, most recent first.
+
+    Args:
+        x_profile_token (str): The profiling token.
+
+    Returns:
+        list: The request ID, method, path, status, duration and time of every profile.
+    """
+    check_token(x_profile_token)
+    return profile_store.list()
+
+
+@profiles_router.get("/{request_id}", response_class=HTMLResponse)
+async def get_profile(request_id: str, x_profile_token: Optional[str] = Header(None)):
+    """
+    Show the flame graph of a profiled request.
+
+    Args:
+        request_id (str): The request ID of the profile.
+        x_profile_token (str): The profiling token.
+
+    Returns:
+        HTMLResponse: The pyinstrument HTML report.
+    """
+    check_token(x_profile_token)
+    html = profile_store.get(request_id)
+    if html is None:
+        raise HTTPException(status_code=404, detail=f"No profile for {request_id}")
+    return HTMLResponse(html)
@@ -0,0 +1,349 @@
+import argparse
+import logging
+import signal
+import time
+import boto3
+from botocore.exceptions import ClientError
+from pydantic import ValidationError
+import redis
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql, sqlite
+from churn_stats import SEED_STATS_QUERY, apply_stats_deltas
+from constants import (
+    DATABASE_URL,
+    FEATURE_CACHE_TTL,
+    REDIS_HOST,
+    REDIS_PORT,
+    STREAM_NAME,
+)
+from data_schema import Base, ChurnData, StreamCheckpoint, TelecomUsers
+from feature_cache import FEATURE_CACHE_PREFIX, FeatureCache
+from record_codec import ENUMS, RecordDecodeError, decode_record
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = [column.name for column in TelecomUsers.__table__.columns]
+# Keeps one multi-row upsert under the 65535 bind parameters Postgres accepts
+MAX_BATCH_SIZE = 3000
+SMALLINT_RANGE = range(-32768, 32768)
+
+
+def invalid_fields(row):
+    """
+    List the fields of a record the TelecomUsers column types would reject.
+
+    One rejected value fails the whole batch upsert, so such records are skipped.
+
+    Args:
+        row (dict): The validated record.
+
+    Returns:
+        list: The names of the fields with unknown levels or out of range integers.
+    """
+    fields = [field for field, levels in ENUMS.items() if row[field] not in levels]
+    fields += [
+        field
+        for field in ("SeniorCitizen", "tenure")
+        if row[field] not in SMALLINT_RANGE
+    ]
+    return fields
+
+
+class StreamConsumer:
+    """
+    Long-running consumer loading the Kinesis stream into the TelecomUsers table.
+
+    Every shard is read in micro-batches of up to batch_size records. Each batch is
+    upserted with a single statement, and the ChurnStats deltas and the shard
+    checkpoint are written in the same transaction. A restarted consumer resumes
+    after the last applied record, and replaying a batch only rewrites the same rows.
+
+    Child shards created by resharding are started once their parents are fully
+    consumed, which keeps per-customer ordering. Cached feature vectors of the
+    upserted customers are invalidated once the batch is committed. Only one
+    consumer should run per stream.
+
+    Attributes:
+        client (boto3.client): The Kinesis client.
+        engine (Engine): The SQLAlchemy engine of the database.
+        stream_name (str): The name of the Kinesis stream.
+        batch_size (int): The maximum number of records read per shard and batch.
+        poll_interval (float): The time in seconds to wait when the stream is idle.
+        start_position (str): Where to start shards without a checkpoint (TRIM_HORIZON or LATEST).
+        shard_refresh_interval (float): The time in seconds between shard list refreshes.
+        feature_cache (FeatureCache): The feature cache to invalidate, or None.
+    """
+
+    def __init__(
+        self,
+        client,
+        engine,
+        stream_name=STREAM_NAME,
+        batch_size=1000,
+        poll_interval=1.0,
+        start_position="TRIM_HORIZON",
+        shard_refresh_interval=60.0,
+        feature_cache=None,
+    ):
+        self.client = client
+        self.engine = engine
+        self.stream_name = stream_name
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.poll_interval = poll_interval
+        self.start_position = start_position
+        self.shard_refresh_interval = shard_refresh_interval
+        self.feature_cache = feature_cache
+        self._iterators = {}
+        self._finished = set()
+        self._running = False
+        # SQLite is supported so the consumer can run against local stand-ins
+        self._insert = (
+            postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+        )
+
+    def load_checkpoints(self):
+        """
+        Load the stored checkpoints of the stream.
+
+        Returns:
+            dict: The StreamCheckpoint rows keyed by shard identifier.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(StreamCheckpoint).where(
+                    StreamCheckpoint.stream_name == self.stream_name
+                )
+            )
+            return {row.shard_id: row for row in rows}
+
+    def list_shards(self):
+        """
+        List every shard of the stream.
+
+        Returns:
+            list: The shard descriptions returned by Kinesis.
+        """
+        shards = []
+        kwargs = {"StreamName": self.stream_name}
+        while True:
+            response = self.client.list_shards(**kwargs)
+            shards.extend(response["Shards"])
+            if "NextToken" not in response:
+                return shards
+            kwargs = {"NextToken": response["NextToken"]}
+
+    def refresh_shards(self):
+        """
+        Open an iterator for every shard that is ready to be consumed.
+
+        A shard is ready when it is not finished and its parents are finished or have
+        expired from the stream. Shards with a checkpoint resume after it.
+        """
+        checkpoints = self.load_checkpoints()
+        shards = self.list_shards()
+        shard_ids = {shard["ShardId"] for shard in shards}
+        self._finished.update(
+            shard_id for shard_id, row in checkpoints.items() if row.finished
+        )
+
+        for shard in shards:
+            shard_id = shard["ShardId"]
+            if shard_id in self._iterators or shard_id in self._finished:
+                continue
+            parents = [
+                shard.get("ParentShardId"),
+                shard.get("AdjacentParentShardId"),
+            ]
+            if any(p in shard_ids and p not in self._finished for p in parents):
+                continue
+
+            kwargs = {"StreamName": self.stream_name, "ShardId": shard_id}
+            checkpoint = checkpoints.get(shard_id)
+            if checkpoint is not None and checkpoint.sequence_number:
+                kwargs["ShardIteratorType"] = "AFTER_SEQUENCE_NUMBER"
+                kwargs["StartingSequenceNumber"] = checkpoint.sequence_number
+            else:
+                kwargs["ShardIteratorType"] = self.start_position
+            iterator = self.client.get_shard_iterator(**kwargs)["ShardIterator"]
+            self._iterators[shard_id] = iterator
+            logger.info(
+                f"Consuming shard {shard_id} from {kwargs['ShardIteratorType']}"
+            )
+
+    def poll(self):
+        """
+        Read and apply one batch from every active shard.
+
+        Returns:
+            int: The number of records read from the stream.
+        """
+        read = 0
+        for shard_id, iterator in list(self._iterators.items()):
+            try:
+                response = self.client.get_records(
+                    ShardIterator=iterator, Limit=self.batch_size
+                )
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code == "ProvisionedThroughputExceededException":
+                    logger.warning(f"Read throttled on shard {shard_id}")
+                    continue
+                if code == "ExpiredIteratorException":
+                    # Reopened from the checkpoint on the next refresh
+                    del self._iterators[shard_id]
+                    continue
+                raise
+
+            records = response["Records"]
+            next_iterator = response.get("NextShardIterator")
+            if records or next_iterator is None:
+                self.apply(shard_id, records, finished=next_iterator is None)
+            read += len(records)
+
+            if next_iterator is None:
+                logger.info(f"Shard {shard_id} is closed and fully consumed")
+                del self._iterators[shard_id]
+                self._finished.add(shard_id)
+            else:
+                self._iterators[shard_id] = next_iterator
+        return read
+
+    def apply(self, shard_id, records, finished=False):
+        """
+        Upsert a batch of records and advance the shard checkpoint in one transaction.
+
+        Args:
+            shard_id (str): The shard the records were read from.
+            records (list): The Kinesis records of the batch.
+            finished (bool): Whether the shard is closed and this is its last batch.
+
+        Returns:
+            int: The number of rows upserted.
+        """
+        rows = {}
+        for record in records:
+            try:
+                user = ChurnData.model_validate(decode_record(record["Data"]))
+            except (RecordDecodeError, ValidationError) as e:
+                logger.warning(
+                    f"Skipping invalid record {record['SequenceNumber']}: {e}"
+                )
+                continue
+            row = user.model_dump()
+            fields = invalid_fields(row)
+            if fields:
+                logger.warning(
+                    f"Skipping record {record['SequenceNumber']} with invalid {', '.join(fields)}"
+                )
+                continue
+            # A multi-row upsert cannot touch the same key twice, keep the latest record
+            rows[user.customerID] = row
+
+        checkpoint = {
+            "stream_name": self.stream_name,
+            "shard_id": shard_id,
+            "finished": finished,
+        }
+        if records:
+            checkpoint["sequence_number"] = records[-1]["SequenceNumber"]
+
+        with self.engine.begin() as conn:
+            if rows:
+                apply_stats_deltas(conn, self._insert, list(rows.values()))
+                stmt = self._insert(TelecomUsers).values(list(rows.values()))
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=["customerID"],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in USER_COLUMNS
+                        if column != "customerID"
+                    },
+                )
+                conn.execute(stmt)
+
+            stmt = self._insert(StreamCheckpoint).values(**checkpoint)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["stream_name", "shard_id"],
+                set_={
+                    key: value
+                    for key, value in checkpoint.items()
+                    if key not in ("stream_name", "shard_id")
+                },
+            )
+            conn.execute(stmt)
+
+        if self.feature_cache is not None:
+            self.feature_cache.invalidate(list(rows))
+        return len(rows)
+
+    def run(self, max_idle_polls=None):
+        """
+        Consume the stream until stopped.
+
+        Args:
+            max_idle_polls (int): Stop after this many consecutive polls without records.
+                Runs forever when None.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(SEED_STATS_QUERY)
+
+        self._running = True
+        idle_polls = 0
+        last_refresh = 0.0
+        while self._running:
+            now = time.monotonic()
+            if not self._iterators or now - last_refresh > self.shard_refresh_interval:
+                self.refresh_shards()
+                last_refresh = now
+
+            if self.poll():
+                idle_polls = 0
+                # Kinesis allows five reads per shard and second
+                time.sleep(0.2)
+            else:
+                idle_polls += 1
+                if max_idle_polls is not None and idle_polls >= max_idle_polls:
+                    break
+                time.sleep(self.poll_interval)
+
+    def stop(self, *args):
+        """
+        Stop the consumer after the batch in progress.
+        """
+        self._running = False
+
+
+if __name__ == "__main__":
+    """
+    Run the stream consumer worker.
+
+    Loads the Kinesis stream into TelecomUsers within seconds of ingestion. The daily
+    s3_to_rds DAG stays in place for backfills.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--start-position", choices=["TRIM_HORIZON", "LATEST"], default="TRIM_HORIZON"
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    Base.metadata.create_all(engine, checkfirst=True)
+    consumer = StreamConsumer(
+        boto3.client("kinesis", region_name="us-east-1"),
+        engine,
+        batch_size=args.batch_size,
+        poll_interval=args.poll_interval,
+        start_position=args.start_position,
+        # Invalidated even when this process has no FEATURE_CACHE, the API may cache
+        feature_cache=FeatureCache(
+            redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0),
+            FEATURE_CACHE_PREFIX,
+            ttl=FEATURE_CACHE_TTL,
+        ),
+    )
+    signal.signal(signal.SIGTERM, consumer.stop)
+    signal.signal(signal.SIGINT, consumer.stop)
+    consumer.run()
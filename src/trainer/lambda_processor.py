@@ -1,18 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import io
 import json
+import random
 import tarfile
+import time
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionClosedError, ReadTimeoutError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
 import os
 import logging
 
-sagemaker = boto3.client("sagemaker")
-sqs = boto3.client("sqs")
-s3 = boto3.client("s3")
-
 MAX_CONCURRENT_JOBS = 30
 QUEUE_URL = os.environ["SQS_QUEUE_URL"]
 DLQ_URL = os.environ["DLQ_URL"]
 MODEL_BUCKET_NAME = os.environ["MODEL_BUCKET_NAME"]
 ROLE_ARN = os.environ["SAGEMAKER_ROLE_ARN"]
+# Records of a batch submitted in parallel, every thread shares the clients below
+SUBMIT_WORKERS = int(os.environ.get("SUBMIT_WORKERS", "10"))
+# At most 3.5s of backoff per call. With the client timeouts below, a call that keeps
+# timing out gives up after about 36s, within the 60s Lambda timeout
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 2.0
+REQUEUED = "left on the queue"
+THROTTLING_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+# Server side errors worth retrying, as in botocore's standard retry mode
+TRANSIENT_CODES = {
+    "InternalError",
+    "InternalFailure",
+    "InternalServerError",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+}
+TRANSIENT_ERRORS = (BotocoreConnectionError, ConnectionClosedError, ReadTimeoutError)
+
+# boto3 clients are thread safe, their pools must fit every worker. Their own retries
+# are off, call_with_backoff is the only retry layer
+client_config = Config(
+    max_pool_connections=max(SUBMIT_WORKERS, 10),
+    retries={"total_max_attempts": 1, "mode": "standard"},
+    connect_timeout=3,
+    read_timeout=5,
+)
+sagemaker = boto3.client("sagemaker", config=client_config)
+sqs = boto3.client("sqs", config=client_config)
+s3 = boto3.client("s3", config=client_config)
+
+
+def retryable(error):
+    """
+    Tell whether a failed AWS call may succeed when retried.
+
+    Args:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for throttling, server side errors, connection errors and timeouts.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    return code in THROTTLING_CODES or code in TRANSIENT_CODES or status >= 500
+
+
+def call_with_backoff(fn, **kwargs):
+    """
+    Call an AWS API, retrying throttling and transient errors with full jitter
+    exponential backoff.
+
+    Args:
+        fn (callable): The boto3 client method.
+        kwargs (dict): The arguments of the call.
+
+    Returns:
+        dict: The response of the call.
+
+    Raises:
+        Exception: If the call fails with another error or still fails after MAX_ATTEMPTS.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return fn(**kwargs)
+        except Exception as e:
+            if not retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+            logging.warning(
+                f"{type(e).__name__} on attempt {attempt + 1}: {e}, "
+                f"retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+
+
+def submit_record(record):
+    """
+    Start the training job of one SQS record.
+
+    Failures only affect their own record: it is sent to the DLQ, and if even that
+    fails its status is REQUEUED so the handler reports it as a batch item failure
+    and SQS redelivers it.
+
+    Args:
+        record (dict): The SQS record.
+
+    Returns:
+        dict: The training job name and whether it started.
+    """
+    training_job_name = None
+    try:
+        body = json.loads(record["body"])
+        training_job_name = body["training_job_name"]
+        response = sagemaker_train(
+            training_job_name,
+            body["s3_path"],
+            body.get("encoding", "onehot"),
+            body.get("chunk_size"),
+        )
+        started = response["ResponseMetadata"]["HTTPStatusCode"] == 200
+    except Exception as e:
+        logging.exception(f"Error starting training job {training_job_name}: {e}")
+        started = False
+
+    if started:
+        status = "started successfully"
+    else:
+        logging.error(f"Failed to start training job {training_job_name}")
+        status = "failed to start"
+        try:
+            call_with_backoff(
+                sqs.send_message, QueueUrl=DLQ_URL, MessageBody=json.dumps(record)
+            )
+        except Exception as e:
+            logging.error(f"Could not send {training_job_name} to the DLQ: {e}")
+            return {"training_job_name": training_job_name, "status": REQUEUED}
+
+    try:
+        call_with_backoff(
+            sqs.delete_message,
+            QueueUrl=QUEUE_URL,
+            ReceiptHandle=record["receiptHandle"],
+        )
+    except Exception as e:
+        logging.error(f"Could not delete the message of {training_job_name}: {e}")
+    return {"training_job_name": training_job_name, "status": status}
 
 
 def lambda_handler(event, context):
@@ -21,19 +164,25 @@ def lambda_handler(event, context):
 
     This function checks the number of currently running SageMaker training jobs and starts new ones
     if there is available capacity. It processes messages from an SQS queue, each containing information
-    about a training job to start. If a training job starts successfully, the message is deleted from
-    the queue. If it fails, the message is sent to a dead-letter queue (DLQ).
+    about a training job to start. The jobs of a batch are submitted concurrently by a bounded thread
+    pool. If a training job starts successfully, the message is deleted from the queue. If it fails,
+    the message is sent to a dead-letter queue (DLQ) without affecting the other records. Messages
+    that could not reach the DLQ either are returned as batchItemFailures, which the event source
+    mapping (with ReportBatchItemFailures) leaves on the queue for redelivery. When the concurrency
+    limit is reached, every message of the batch is returned that way.
 
     Args:
         event (dict): The event data passed to the Lambda function, containing SQS messages.
         context (object): The context in which the Lambda function is called.
 
     Returns:
-        dict: A response object containing the status code and a message.
+        dict: A response object containing the status code, a message and the batch item failures.
     """
     print("Event:", event)
     # Get the number of currently running training jobs
-    response = sagemaker.list_training_jobs(StatusEquals="InProgress")
+    response = call_with_backoff(
+        sagemaker.list_training_jobs, StatusEquals="InProgress"
+    )
     running_jobs = len(response["TrainingJobSummaries"])
     available_capacity = MAX_CONCURRENT_JOBS - running_jobs
 
@@ -42,38 +191,50 @@ def lambda_handler(event, context):
 
     # Check if we can start a new training job
     if available_capacity > 0:
-        # Poll a message from the SQS queue
-        results = []
-        for record in event['Records']:
-            receipt_handle = record["receiptHandle"]
-            body = json.loads(record["body"])
-            input_s3_path = body["s3_path"]
-            training_job_name = body["training_job_name"]
-            response = sagemaker_train(training_job_name, input_s3_path)
-            if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
-                results.append(
-                    {
-                        "training_job_name": training_job_name,
-                        "status": "started successfully",
-                    }
-                )
-            else:
-                logging.error(f"Failed to start training job {training_job_name}")
-                sqs.send_message(QueueUrl=DLQ_URL, MessageBody=json.dumps(record))
-                results.append(
-                    {
-                        "training_job_name": training_job_name,
-                        "status": "failed to start",
-                    }
-                )
-            sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=receipt_handle)
-
-        return {"statusCode": 200, "body": json.dumps(results)}
+        records = event["Records"]
+        if not records:
+            return {"statusCode": 200, "body": json.dumps([]), "batchItemFailures": []}
+        with ThreadPoolExecutor(
+            max_workers=min(SUBMIT_WORKERS, len(records))
+        ) as executor:
+            results = list(executor.map(submit_record, records))
+
+        failures = [
+            {"itemIdentifier": record["messageId"]}
+            for record, result in zip(records, results)
+            if result["status"] == REQUEUED
+        ]
+        return {
+            "statusCode": 200,
+            "body": json.dumps(results),
+            "batchItemFailures": failures,
+        }
     else:
-        return {"statusCode": 200, "body": json.dumps("Concurrency limit reached")}
+        # Reported as failures so SQS redelivers them after the visibility timeout
+        return {
+            "statusCode": 200,
+            "body": json.dumps("Concurrency limit reached"),
+            "batchItemFailures": [
+                {"itemIdentifier": record["messageId"]} for record in event["Records"]
+            ],
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def source_tarball():
+    """
+    Build the tarball of the training script once per container.
+
+    Returns:
+        bytes: The gzipped tarball holding train.py.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        tar.add("train.py")
+    return buffer.getvalue()
 
 
-def sagemaker_train(training_job_name, trainpath):
+def sagemaker_train(training_job_name, trainpath, encoding="onehot", chunk_size=None):
     """
     Create and start a SageMaker training job.
 
@@ -83,31 +244,42 @@ def sagemaker_train(training_job_name, trainpath):
     Args:
         training_job_name (str): The name of the training job.
         trainpath (str): The S3 path to the training data.
+        encoding (str): The categorical feature encoding passed to train.py ("onehot" or "compact").
+        chunk_size (int): The chunk size for out of core training, or None to train in memory.
 
     Returns:
         dict: The response from the SageMaker create_training_job API call.
     """
-    source = "/tmp/source.tar.gz"  # Use /tmp directory
     try:
-        with tarfile.open(source, "w:gz") as tar:
-            tar.add("train.py")
+        source = source_tarball()
     except Exception as e:
         print(f"Error creating tar file: {e}")
         raise
 
     try:
-        s3.upload_file(source, MODEL_BUCKET_NAME, f"{training_job_name}/source.tar.gz")
+        call_with_backoff(
+            s3.put_object,
+            Bucket=MODEL_BUCKET_NAME,
+            Key=f"{training_job_name}/source.tar.gz",
+            Body=source,
+        )
     except Exception as e:
         print(f"Error uploading to S3: {e}")
         raise
 
+    hyperparameters = {
+        "sagemaker_program": "train.py",
+        "sagemaker_submit_directory": f"s3://{MODEL_BUCKET_NAME}/{training_job_name}/source.tar.gz",
+        "encoding": encoding,
+    }
+    if chunk_size:
+        hyperparameters["chunk_size"] = str(chunk_size)
+
     try:
-        response = sagemaker.create_training_job(
+        response = call_with_backoff(
+            sagemaker.create_training_job,
             TrainingJobName=training_job_name,
-            HyperParameters={
-                "sagemaker_program": "train.py",
-                "sagemaker_submit_directory": f"s3://{MODEL_BUCKET_NAME}/{training_job_name}/source.tar.gz",
-            },
+            HyperParameters=hyperparameters,
             AlgorithmSpecification={
                 "TrainingImage": "683313688378.dkr.ecr.us-east-1.amazonaws.com/sagemaker-scikit-learn:1.2-1-cpu-py3",
                 "TrainingInputMode": "File",
@@ -1,8 +1,17 @@
+import argparse
+from functools import partial
 import os
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.compose import make_column_transformer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import (
+    FunctionTransformer,
+    OneHotEncoder,
+    OrdinalEncoder,
+    StandardScaler,
+)
 from sklearn.ensemble import RandomForestClassifier
 import logging
 
@@ -10,16 +19,92 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def preprocess_data(df):
+ENCODINGS = ("onehot", "compact")
+N_ESTIMATORS = 100
+CATEGORICAL_COLS = [
+    "gender",
+    "SeniorCitizen",
+    "Partner",
+    "Dependents",
+    "PhoneService",
+    "MultipleLines",
+    "InternetService",
+    "OnlineSecurity",
+    "OnlineBackup",
+    "DeviceProtection",
+    "TechSupport",
+    "StreamingTV",
+    "StreamingMovies",
+    "Contract",
+    "PaperlessBilling",
+    "PaymentMethod",
+]
+CONTINUOUS_COLS = ["tenure", "MonthlyCharges", "TotalCharges"]
+
+
+def make_transformer(encoding="onehot", categories=None):
+    """
+    Build the unfitted feature transformer for an encoding.
+
+    Args:
+        encoding (str): The categorical encoding to use ("onehot" or "compact").
+        categories (dict): The levels of every categorical column. By default they are
+            learnt from the data the transformer is fit on.
+
+    Returns:
+        Pipeline: The transformer scaling continuous and encoding categorical columns.
+
+    Raises:
+        ValueError: If the encoding is unknown.
+    """
+    levels = [categories[col] for col in CATEGORICAL_COLS] if categories else "auto"
+    if encoding == "compact":
+        return make_pipeline(
+            make_column_transformer(
+                (StandardScaler(), CONTINUOUS_COLS),
+                (
+                    OrdinalEncoder(
+                        categories=levels,
+                        handle_unknown="use_encoded_value",
+                        unknown_value=-1,
+                        dtype=np.float32,
+                    ),
+                    CATEGORICAL_COLS,
+                ),
+            ),
+            # RandomForestClassifier works on float32 internally, so emitting float32
+            # here avoids an extra float64 copy in both fit and predict. A numpy
+            # callable keeps the pickled transformer loadable outside this script.
+            FunctionTransformer(partial(np.asarray, dtype=np.float32)),
+        )
+    if encoding == "onehot":
+        return make_column_transformer(
+            (StandardScaler(), CONTINUOUS_COLS),
+            (
+                OneHotEncoder(categories=levels, handle_unknown="ignore"),
+                CATEGORICAL_COLS,
+            ),
+        )
+    raise ValueError(
+        f"Unknown encoding {encoding}, expected one of {', '.join(ENCODINGS)}"
+    )
+
+
+def preprocess_data(df, encoding="onehot", model_dir="/opt/ml/model"):
     """
     Preprocess the input DataFrame by scaling continuous features and encoding categorical features.
 
     This function takes a DataFrame, scales the continuous columns using StandardScaler,
-    and encodes the categorical columns using OneHotEncoder. The fitted transformer is saved
-    to a specified path.
+    and encodes the categorical columns. With the default "onehot" encoding the categorical
+    columns are one-hot encoded. With the "compact" encoding they are ordinal encoded into
+    small integer codes and the whole matrix is emitted as float32, which keeps one column
+    per feature instead of one per level. The fitted transformer is saved to a specified
+    path, so inference picks up the encoding without any extra configuration.
 
     Args:
         df (pd.DataFrame): The input DataFrame to preprocess.
+        encoding (str): The categorical encoding to use ("onehot" or "compact").
+        model_dir (str): The directory the fitted transformer is saved to.
 
     Returns:
         np.ndarray: The transformed feature matrix.
@@ -28,32 +113,10 @@ def preprocess_data(df):
         Exception: If there is an error during preprocessing.
     """
     try:
-        categorical_cols = [
-            "gender",
-            "SeniorCitizen",
-            "Partner",
-            "Dependents",
-            "PhoneService",
-            "MultipleLines",
-            "InternetService",
-            "OnlineSecurity",
-            "OnlineBackup",
-            "DeviceProtection",
-            "TechSupport",
-            "StreamingTV",
-            "StreamingMovies",
-            "Contract",
-            "PaperlessBilling",
-            "PaymentMethod",
-        ]
-        continuous_cols = ["tenure", "MonthlyCharges", "TotalCharges"]
-        transformer = make_column_transformer(
-            (StandardScaler(), continuous_cols),
-            (OneHotEncoder(handle_unknown="ignore"), categorical_cols),
-        )
+        transformer = make_transformer(encoding)
         transformer.fit(df)
         X = transformer.transform(df)
-        transformer_output_path = os.path.join("/opt/ml/model", "transformer.joblib")
+        transformer_output_path = os.path.join(model_dir, "transformer.joblib")
         joblib.dump(transformer, transformer_output_path)
 
         return X
@@ -62,6 +125,147 @@ def preprocess_data(df):
         raise
 
 
+def read_chunks(path, chunk_size):
+    """
+    Read and clean the training CSV one chunk at a time.
+
+    Args:
+        path (str): The path to the CSV file.
+        chunk_size (int): The number of rows per chunk.
+
+    Yields:
+        pd.DataFrame: The next chunk, without customerID and rows missing TotalCharges.
+    """
+    for df in pd.read_csv(path, chunksize=chunk_size):
+        df = df.drop("customerID", axis=1)
+        df.TotalCharges = pd.to_numeric(df.TotalCharges, errors="coerce")
+        df = df.dropna()
+        if not df.empty:
+            yield df
+
+
+def scan_data(path, chunk_size, sample_size, seed=42):
+    """
+    Collect what fitting the transformer needs in one streaming pass over the CSV.
+
+    Every chunk row draws a random key and the rows with the smallest keys are kept,
+    which leaves a uniform sample of the whole file without knowing its length.
+
+    Args:
+        path (str): The path to the CSV file.
+        chunk_size (int): The number of rows per chunk.
+        sample_size (int): The number of rows to sample.
+        seed (int): The seed of the sampling.
+
+    Returns:
+        tuple: The number of rows, the sorted levels of every categorical column and
+            of Churn, and the sampled rows.
+    """
+    rng = np.random.default_rng(seed)
+    levels = {col: set() for col in CATEGORICAL_COLS + ["Churn"]}
+    rows = 0
+    sample = None
+    for df in read_chunks(path, chunk_size):
+        rows += len(df)
+        for col, values in levels.items():
+            values.update(df[col].unique())
+        df = df.assign(sample_key=rng.random(len(df)))
+        if sample is not None:
+            df = pd.concat([sample, df])
+        sample = df.nsmallest(sample_size, "sample_key")
+    return (
+        rows,
+        {col: sorted(values) for col, values in levels.items()},
+        sample.drop(columns="sample_key"),
+    )
+
+
+def training_chunks(path, chunk_size, classes):
+    """
+    Read the training CSV in chunks that each contain every Churn class.
+
+    A chunk missing a class, or smaller than half the chunk size, is folded into the
+    next one. Whatever is left at the end is folded into the previous chunk, so the
+    short last chunk of the file is never trained on alone.
+
+    Args:
+        path (str): The path to the CSV file.
+        chunk_size (int): The number of rows per chunk read from the file.
+        classes (list): The sorted Churn classes of the whole file.
+
+    Yields:
+        pd.DataFrame: The next chunk containing every Churn class.
+    """
+    pending = None
+    ready = None
+    for df in read_chunks(path, chunk_size):
+        pending = df if pending is None else pd.concat([pending, df])
+        if (
+            len(pending) >= chunk_size // 2
+            and list(np.unique(pending["Churn"])) == classes
+        ):
+            if ready is not None:
+                yield ready
+            ready, pending = pending, None
+    if pending is not None:
+        ready = pending if ready is None else pd.concat([ready, pending])
+    if ready is not None:
+        yield ready
+
+
+def train_chunked(
+    path,
+    encoding="onehot",
+    chunk_size=100000,
+    sample_size=100000,
+    model_dir="/opt/ml/model",
+):
+    """
+    Train the model without loading the whole CSV into memory.
+
+    A first pass fits the transformer on a uniform sample, with the category levels
+    of the full file, and saves it. A second pass grows the forest with warm_start,
+    fitting a share of the N_ESTIMATORS trees proportional to its rows on every
+    chunk, so each tree sees one chunk instead of a bootstrap of the whole table.
+    With more chunks than trees, some chunks get no tree and their rows are unused,
+    so keep the chunk size above rows / N_ESTIMATORS. While a chunk is fit, the next
+    one is already read and the last one also absorbs the short tail of the file,
+    so the peak is about two to three chunks of rows plus the features of the chunk
+    being fit. Chunks missing a class are merged with the next ones, see
+    training_chunks, so a run of them is held in full and input sorted by Churn can
+    need the whole file in memory.
+
+    Args:
+        path (str): The path to the CSV file.
+        encoding (str): The categorical encoding to use ("onehot" or "compact").
+        chunk_size (int): The number of rows per chunk.
+        sample_size (int): The number of rows the transformer is fit on.
+        model_dir (str): The directory the fitted transformer is saved to.
+
+    Returns:
+        RandomForestClassifier: The trained model.
+    """
+    rows, levels, sample = scan_data(path, chunk_size, sample_size)
+    classes = levels.pop("Churn")
+    transformer = make_transformer(encoding, categories=levels)
+    transformer.fit(sample)
+    joblib.dump(transformer, os.path.join(model_dir, "transformer.joblib"))
+    del sample
+
+    logger.info(f"Training {N_ESTIMATORS} trees on {rows} rows")
+    model = RandomForestClassifier(n_estimators=0, warm_start=True, random_state=42)
+    seen = 0
+    for i, df in enumerate(training_chunks(path, chunk_size, classes)):
+        seen += len(df)
+        n_estimators = round(N_ESTIMATORS * seen / rows)
+        if n_estimators <= model.n_estimators:
+            logger.warning(f"Skipping chunk {i}, its share of the trees rounds to none")
+            continue
+        model.n_estimators = n_estimators
+        model.fit(transformer.transform(df), df["Churn"].values)
+    return model
+
+
 if __name__ == "__main__":
     """
     Main script to load data, preprocess it, train a RandomForest model, and save the model.
@@ -73,24 +277,44 @@ if __name__ == "__main__":
     Raises:
         Exception: If there is an error during any step of the process.
     """
+    parser = argparse.ArgumentParser()
+    # SageMaker passes hyperparameters as command line arguments
+    parser.add_argument("--encoding", choices=ENCODINGS, default="onehot")
+    # A positive chunk size trains out of core, see train_chunked
+    parser.add_argument("--chunk_size", type=int, default=0)
+    parser.add_argument("--sample_size", type=int, default=100000)
+    args, _ = parser.parse_known_args()
+
     try:
         input_data_path = os.path.join("/opt/ml/input/data/train", "input.csv")
-        logger.info(f"Loading data from {input_data_path}")
-        df = pd.read_csv(input_data_path)
+        if args.chunk_size > 0:
+            logger.info(
+                f"Training on {input_data_path} in chunks of {args.chunk_size} rows"
+                f" with {args.encoding} encoding"
+            )
+            model = train_chunked(
+                input_data_path,
+                encoding=args.encoding,
+                chunk_size=args.chunk_size,
+                sample_size=args.sample_size,
+            )
+        else:
+            logger.info(f"Loading data from {input_data_path}")
+            df = pd.read_csv(input_data_path)
 
-        df = df.drop("customerID", axis=1)
-        df.TotalCharges = pd.to_numeric(df.TotalCharges, errors="coerce")
-        df.dropna(inplace=True)
+            df = df.drop("customerID", axis=1)
+            df.TotalCharges = pd.to_numeric(df.TotalCharges, errors="coerce")
+            df.dropna(inplace=True)
 
-        # Preprocess data
-        logger.info("Preprocessing data")
-        X = preprocess_data(df)
-        y = df["Churn"].values
+            # Preprocess data
+            logger.info(f"Preprocessing data with {args.encoding} encoding")
+            X = preprocess_data(df, encoding=args.encoding)
+            y = df["Churn"].values
 
-        # Train model
-        logger.info("Training model")
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        model.fit(X, y)
+            # Train model
+            logger.info("Training model")
+            model = RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=42)
+            model.fit(X, y)
 
         # Save model
         model_output_path = os.path.join("/opt/ml/model", "model.joblib")
@@ -122,7 +122,7 @@ resource "aws_lambda_function" "my_lambda" {
   handler          = "lambda_processor.lambda_handler"
   runtime          = "python3.11" # Change runtime as needed
   source_code_hash = filebase64sha256("lambda.zip")
-  timeout          = 30
+  timeout          = 60
 
   environment {
     variables = {
@@ -130,6 +130,7 @@ resource "aws_lambda_function" "my_lambda" {
       DLQ_URL = aws_sqs_queue.my_dlq.url
       MODEL_BUCKET_NAME = aws_s3_bucket.model_bucket.bucket
       SAGEMAKER_ROLE_ARN = aws_iam_role.sagemaker_role.arn
+      SUBMIT_WORKERS = 10
     }
   }
 }
@@ -139,6 +140,8 @@ resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   function_name     = aws_lambda_function.my_lambda.arn
   batch_size        = 10
   enabled           = true
+  # Records the handler could not start nor dead-letter stay on the queue
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 output "sqs_url" {
@@ -74,4 +74,99 @@ resource "aws_security_group" "mwaa_sg" {
     protocol    = "-1"
     cidr_blocks = ["0.0.0.0/0"]
   }
-}
\ No newline at end of file
+}
+# Lets the batch_scoring DAG run pods on EKS, see dags/batch_scoring_dag.py
+resource "aws_iam_role_policy" "mwaa_eks_policy" {
+  name = "mwaa-eks-policy"
+  role = aws_iam_role.mwaa_role.id
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["eks:DescribeCluster"]
+        Resource = aws_eks_cluster.cluster.arn
+      }
+    ]
+  })
+}
+
+provider "kubernetes" {
+  host                   = aws_eks_cluster.cluster.endpoint
+  cluster_ca_certificate = base64decode(aws_eks_cluster.cluster.certificate_authority[0].data)
+  exec {
+    api_version = "client.authentication.k8s.io/v1beta1"
+    args        = ["eks", "get-token", "--cluster-name", aws_eks_cluster.cluster.id]
+    command     = "aws"
+  }
+}
+
+# Maps the MWAA execution role to the airflow user, next to the node role mapping
+resource "kubernetes_config_map_v1_data" "aws_auth" {
+  metadata {
+    name      = "aws-auth"
+    namespace = "kube-system"
+  }
+  force = true
+  data = {
+    mapRoles = yamlencode([
+      {
+        rolearn  = aws_iam_role.nodes.arn
+        username = "system:node:{{EC2PrivateDNSName}}"
+        groups   = ["system:bootstrappers", "system:nodes"]
+      },
+      {
+        rolearn  = aws_iam_role.mwaa_role.arn
+        username = "airflow"
+        groups   = []
+      }
+    ])
+  }
+
+  depends_on = [aws_eks_node_group.private_nodes]
+}
+
+resource "kubernetes_role_v1" "airflow_pods" {
+  metadata {
+    name      = "airflow-pods"
+    namespace = "default"
+  }
+  rule {
+    api_groups = [""]
+    resources  = ["pods", "pods/log"]
+    verbs      = ["create", "get", "list", "watch", "patch", "delete"]
+  }
+  rule {
+    api_groups = [""]
+    resources  = ["events"]
+    verbs      = ["list"]
+  }
+}
+
+resource "kubernetes_role_binding_v1" "airflow_pods" {
+  metadata {
+    name      = "airflow-pods"
+    namespace = "default"
+  }
+  role_ref {
+    api_group = "rbac.authorization.k8s.io"
+    kind      = "Role"
+    name      = kubernetes_role_v1.airflow_pods.metadata[0].name
+  }
+  subject {
+    api_group = "rbac.authorization.k8s.io"
+    kind      = "User"
+    name      = "airflow"
+  }
+}
+
+# DATABASE_URL of the batch scoring pods, see dags/batch_scoring_dag.py
+resource "kubernetes_secret_v1" "batch_scoring_db" {
+  metadata {
+    name      = "batch-scoring-db"
+    namespace = "default"
+  }
+  data = {
+    DATABASE_URL = "postgresql://${aws_db_instance.default.username}:${aws_db_instance.default.password}@${aws_db_instance.default.address}:${aws_db_instance.default.port}/${aws_db_instance.default.db_name}"
+  }
+}
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("SQS_QUEUE_URL", "https://sqs.local/training-queue")
+os.environ.setdefault("DLQ_URL", "https://sqs.local/training-dlq")
+os.environ.setdefault("MODEL_BUCKET_NAME", "model-bucket")
+os.environ.setdefault("SAGEMAKER_ROLE_ARN", "arn:aws:iam::000000000000:role/sagemaker")
+
+from src.trainer import lambda_processor  # noqa: E402
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Operation")
+
+
+class StubSageMaker:
+    """Records the training jobs, failing or throttling the ones it is told to."""
+
+    def __init__(self, delay=0.0, failing=(), throttled=None, errors=None, running=0):
+        self.delay = delay
+        self.failing = set(failing)
+        self.throttled = dict(throttled or {})
+        self.errors = {name: list(raised) for name, raised in (errors or {}).items()}
+        self.running = running
+        self.started = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def list_training_jobs(self, **kwargs):
+        return {"TrainingJobSummaries": [{}] * self.running}
+
+    def create_training_job(self, TrainingJobName, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            with self.lock:
+                if self.throttled.get(TrainingJobName, 0) > 0:
+                    self.throttled[TrainingJobName] -= 1
+                    raise client_error("ThrottlingException")
+                if self.errors.get(TrainingJobName):
+                    raise self.errors[TrainingJobName].pop(0)
+            if TrainingJobName in self.failing:
+                raise client_error("ValidationException")
+            with self.lock:
+                self.started.append(TrainingJobName)
+            return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class StubSQS:
+    def __init__(self, dlq_fails=False):
+        self.dlq_fails = dlq_fails
+        self.dead_lettered = []
+        self.deleted = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        if self.dlq_fails:
+            raise client_error("InternalError")
+        self.dead_lettered.append(json.loads(MessageBody)["messageId"])
+        return {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.deleted.append(ReceiptHandle)
+        return {}
+
+
+class StubS3:
+    def put_object(self, **kwargs):
+        return {}
+
+
+def make_event(*names):
+    return {
+        "Records": [
+            {
+                "messageId": f"id-{name}",
+                "receiptHandle": f"handle-{name}",
+                "body": json.dumps({"training_job_name": name, "s3_path": "s3://in/"}),
+            }
+            for name in names
+        ]
+    }
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the backoff delays instead of sleeping them."""
+    delays = []
+    monkeypatch.setattr(lambda_processor.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    def install(sagemaker, sqs=None):
+        sqs = sqs or StubSQS()
+        monkeypatch.setattr(lambda_processor, "sagemaker", sagemaker)
+        monkeypatch.setattr(lambda_processor, "sqs", sqs)
+        monkeypatch.setattr(lambda_processor, "s3", StubS3())
+        monkeypatch.setattr(lambda_processor, "source_tarball", lambda: b"source")
+        return sagemaker, sqs
+
+    return install
+
+
+def test_clients_do_not_retry_on_their_own():
+    retries = lambda_processor.sagemaker.meta.config.retries
+    assert retries["total_max_attempts"] == 1
+
+
+def test_records_are_submitted_concurrently(stubs):
+    sagemaker, sqs = stubs(StubSageMaker(delay=0.2))
+    names = [f"job-{i}" for i in range(5)]
+
+    response = lambda_processor.lambda_handler(make_event(*names), None)
+
+    assert sagemaker.max_active > 1
+    assert sorted(sagemaker.started) == names
+    assert sorted(sqs.deleted) == [f"handle-{name}" for name in names]
+    assert response["batchItemFailures"] == []
+
+
+def test_failing_record_does_not_affect_the_others(stubs):
+    sagemaker, sqs = stubs(StubSageMaker(failing={"bad"}))
+
+    response = lambda_processor.lambda_handler(make_event("a", "bad", "b"), None)
+
+    results = {
+        result["training_job_name"]: result["status"]
+        for result in json.loads(response["body"])
+    }
+    assert results == {
+        "a": "started successfully",
+        "bad": "failed to start",
+        "b": "started successfully",
+    }
+    assert sorted(sagemaker.started) == ["a", "b"]
+    assert response["batchItemFailures"] == []
+
+
+def test_failed_record_is_sent_to_the_dlq(stubs):
+    _, sqs = stubs(StubSageMaker(failing={"bad"}))
+
+    lambda_processor.lambda_handler(make_event("a", "bad"), None)
+
+    assert sqs.dead_lettered == ["id-bad"]
+    assert sorted(sqs.deleted) == ["handle-a", "handle-bad"]
+
+
+def test_record_is_reported_when_the_dlq_fails(stubs, sleeps):
+    _, sqs = stubs(StubSageMaker(failing={"bad"}), StubSQS(dlq_fails=True))
+
+    response = lambda_processor.lambda_handler(make_event("a", "bad"), None)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "id-bad"}]
+    assert sqs.deleted == ["handle-a"]
+
+
+def test_throttling_is_retried_with_backoff(stubs, sleeps):
+    sagemaker, sqs = stubs(StubSageMaker(throttled={"a": 2}))
+
+    response = lambda_processor.lambda_handler(make_event("a"), None)
+
+    assert sagemaker.started == ["a"]
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= lambda_processor.BACKOFF_BASE
+    assert 0 <= sleeps[1] <= lambda_processor.BACKOFF_BASE * 2
+    assert sqs.dead_lettered == []
+    assert response["batchItemFailures"] == []
+
+
+def test_throttling_gives_up_after_max_attempts(stubs, sleeps):
+    throttled = {"a": lambda_processor.MAX_ATTEMPTS}
+    sagemaker, sqs = stubs(StubSageMaker(throttled=throttled))
+
+    lambda_processor.lambda_handler(make_event("a"), None)
+
+    assert sagemaker.started == []
+    assert len(sleeps) == lambda_processor.MAX_ATTEMPTS - 1
+    assert all(delay <= lambda_processor.BACKOFF_CAP for delay in sleeps)
+    assert sqs.dead_lettered == ["id-a"]
+
+
+def test_transient_errors_are_retried(stubs, sleeps):
+    errors = {"a": [client_error("InternalError"), ReadTimeoutError(endpoint_url="x")]}
+    sagemaker, sqs = stubs(StubSageMaker(errors=errors))
+
+    lambda_processor.lambda_handler(make_event("a"), None)
+
+    assert sagemaker.started == ["a"]
+    assert len(sleeps) == 2
+    assert sqs.dead_lettered == []
+
+
+def test_other_errors_are_not_retried(stubs, sleeps):
+    _, sqs = stubs(StubSageMaker(failing={"a"}))
+
+    lambda_processor.lambda_handler(make_event("a"), None)
+
+    assert sleeps == []
+    assert sqs.dead_lettered == ["id-a"]
+
+
+def test_concurrency_limit_leaves_every_record_on_the_queue(stubs):
+    running = lambda_processor.MAX_CONCURRENT_JOBS
+    sagemaker, sqs = stubs(StubSageMaker(running=running))
+
+    response = lambda_processor.lambda_handler(make_event("a", "b"), None)
+
+    assert response["batchItemFailures"] == [
+        {"itemIdentifier": "id-a"},
+        {"itemIdentifier": "id-b"},
+    ]
+    assert sagemaker.started == []
+    assert sqs.deleted == []
+    assert sqs.dead_lettered == []
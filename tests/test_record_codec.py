@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from src.record_codec import (
+    COMPACT_V1,
+    RecordDecodeError,
+    decode_record,
+    encode_record,
+    iter_records,
+)
+
+RECORD = {
+    "customerID": "7590-VHVEG",
+    "gender": "Female",
+    "SeniorCitizen": 0,
+    "Partner": "Yes",
+    "Dependents": "No",
+    "tenure": 1,
+    "PhoneService": "No",
+    "MultipleLines": "No phone service",
+    "InternetService": "DSL",
+    "OnlineSecurity": "No",
+    "OnlineBackup": "Yes",
+    "DeviceProtection": "No",
+    "TechSupport": "No",
+    "StreamingTV": "No",
+    "StreamingMovies": "No",
+    "Contract": "Month-to-month",
+    "PaperlessBilling": "Yes",
+    "PaymentMethod": "Electronic check",
+    "MonthlyCharges": 29.85,
+    "TotalCharges": "29.85",
+    "Churn": "No",
+}
+
+
+def record(**changes):
+    return {**RECORD, **changes}
+
+
+def as_json(record):
+    return json.dumps(record).encode()
+
+
+def decoded(data):
+    return [record for record, _ in iter_records(data)]
+
+
+def test_compact_round_trip():
+    data = encode_record(RECORD)
+
+    assert data[0] == COMPACT_V1
+    assert decode_record(data) == RECORD
+
+
+def test_compact_keeps_unknown_levels_as_strings():
+    data = encode_record(record(Contract="Three year"))
+
+    assert decode_record(data)["Contract"] == "Three year"
+
+
+def test_json_round_trip():
+    assert decode_record(as_json(RECORD)) == RECORD
+    assert decode_record(json.dumps(RECORD)) == RECORD
+
+
+def test_malformed_records_raise():
+    with pytest.raises(RecordDecodeError):
+        decode_record(b'{"customerID":')
+    with pytest.raises(RecordDecodeError):
+        decode_record(b"[1, 2]")
+    with pytest.raises(RecordDecodeError):
+        decode_record(bytes([COMPACT_V1]) + b"\xc1")
+
+
+def test_mixed_records_are_split():
+    second = record(customerID="5575-GNVDE", Churn="Yes")
+    data = as_json(RECORD) + encode_record(second) + b"\n" + as_json(second)
+
+    assert decoded(data) == [RECORD, second, second]
+
+
+def test_raw_bytes_cover_each_record():
+    parts = [as_json(RECORD), encode_record(RECORD), as_json(RECORD)]
+
+    assert [raw for _, raw in iter_records(b"".join(parts))] == parts
+
+
+def test_braces_inside_strings_do_not_split_json():
+    tricky = record(PaymentMethod='}{"x": 1}\x01')
+
+    assert decoded(as_json(tricky) + as_json(RECORD)) == [tricky, RECORD]
+
+
+def test_non_ascii_json_is_decoded_as_utf8():
+    accented = record(customerID="Zoë-1")
+    data = json.dumps(accented, ensure_ascii=False).encode()
+
+    assert decoded(data + encode_record(RECORD)) == [accented, RECORD]
+
+
+def test_truncated_json_does_not_swallow_the_next_record():
+    data = b'{"bad":' + encode_record(RECORD)
+
+    items = list(iter_records(data))
+
+    assert items[0] == (None, b'{"bad":')
+    assert items[1][0] == RECORD
+
+
+def test_truncated_json_resyncs_at_the_next_json_record():
+    data = b'{"customerID": "x", "tenure":' + as_json(RECORD)
+
+    assert decoded(data) == [None, RECORD]
+
+
+def test_json_that_is_not_an_object_is_malformed():
+    assert decoded(b"[1, 2]" + as_json(RECORD)) == [None, RECORD]
+
+
+def test_truncated_compact_record_is_malformed():
+    truncated = encode_record(RECORD)[:-5]
+
+    items = list(iter_records(as_json(RECORD) + truncated))
+
+    assert items == [(RECORD, as_json(RECORD)), (None, truncated)]
+
+
+def test_compact_record_with_wrong_fields_is_malformed():
+    data = bytes([COMPACT_V1]) + bytes([0x91, 0x01]) + encode_record(RECORD)
+
+    assert decoded(data) == [None, RECORD]